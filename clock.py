@@ -2,22 +2,50 @@
     It checks changes to the display and updates the screen accordingly."""
 
 import logging
+import time
 
 import asyncio
 
+from lib.frame_builder.compositor import union_regions
 from lib.frame_builder.frame import Frame
 from lib.epd_driver import EPDDriver
+from lib.display_pipeline import DisplayPipeline
+from lib.services.api import get_http_client
+from lib.services.snapshot_store import get_snapshot_store
 
-from config import get_config
+from config import get_config, reload_config, ConfigWatcher
+from font_helper import preload_fonts
 
 logger = logging.getLogger()
 
+# Seconds to let an editor finish writing config.ini before reloading it
+CONFIG_SETTLE_TIME = 0.2
+# Seconds between checks of config.ini where inotify is not available
+CONFIG_POLL_INTERVAL = 5
+# Settings only read when the clock starts
+RESTART_SETTINGS = {
+    ("LOGGING", "file"),
+    ("FRAME", "clock_dimensions"),
+    ("FRAME", "banner_dimensions"),
+    ("FRAME", "infos_enabled"),
+    ("FRAME", "background_cache_size"),
+    ("FRAME", "background_cache_dir"),
+    ("HTTP", "pool_size"),
+    ("HTTP", "cache_dir")
+}
+
 class Clock():
     """Class to handle the clock display on the e-ink screen. 
         Use the run_clock method to start the clock."""
     def __init__(self):
         logger.debug("[epd2in13_V4] Initialising Clock...")
+        preload_fonts()
         self._epd_driver = EPDDriver()
+        self._display = DisplayPipeline(self._epd_driver)
+        self._dirty = asyncio.Event()
+        self._config_watcher = ConfigWatcher()
+        self._config_task = None
+        self._service_tasks = []
         self._frame = Frame(
             self._epd_driver.get_dimensions(),
             (
@@ -38,17 +66,20 @@ class Clock():
         else:
             logger.info("[Clock] Background set to: %s", image)
             self._frame.set_background(image)
+        self.mark_dirty()
 
     def set_text_panel(self, text):
         """Set the text panel to the specified string."""
         logger.info("[Clock] Text Panel set to: %s", text)
         self._frame.set_text_panel(text)
+        self.mark_dirty()
 
     def set_alignment(self, vertical_alignment, horizontal_alignment):
         """Set the alignment of the frame."""
         logger.info("[Clock] Alignment set to: %s, %s", vertical_alignment, horizontal_alignment)
         self._frame.set_vertical_alignment(vertical_alignment)
         self._frame.set_horizontal_alignment(horizontal_alignment)
+        self.mark_dirty()
 
     def get_info_panel_descriptions(self):
         """Return the descriptions of the info panels."""
@@ -58,21 +89,123 @@ class Clock():
         """Return the descriptions of the banner panels."""
         logger.info("%s\n","\n".join(self._frame.get_banner_panel_descriptions()))
 
+    def apply_config(self, changes):
+        """Apply the settings of config.ini that changed to the display, frame, panels and services."""
+        if len(changes) == 0:
+            return
+        logger.info(
+            "[Clock] config.ini changed: %s",
+            ", ".join(f"{section}.{key}" for section, key in sorted(changes))
+        )
+        config = get_config()
+        if ("LOGGING", "level") in changes:
+            logger.setLevel(config.logging.level)
+        if ("DISPLAY", "sleep_threshold") in changes:
+            self._epd_driver.set_sleep_threshold(config.display.sleep_threshold)
+        if ("FONTS", "preload_sizes") in changes:
+            preload_fonts()
+        restart = sorted(changes & RESTART_SETTINGS)
+        if len(restart) > 0:
+            logger.warning(
+                "[Clock] Restart the clock to apply %s",
+                ", ".join(f"{section}.{key}" for section, key in restart)
+            )
+        self._frame.apply_config(changes)
+        self.mark_dirty()
+
+    async def _watch_config(self):
+        """Reload config.ini whenever it changes and apply the changed settings."""
+        loop = asyncio.get_running_loop()
+        fd = self._config_watcher.fileno()
+        changed = asyncio.Event()
+        if fd is not None:
+            def on_event():
+                if self._config_watcher.has_changed():
+                    changed.set()
+            loop.add_reader(fd, on_event)
+        try:
+            while True:
+                if fd is None:
+                    await asyncio.sleep(CONFIG_POLL_INTERVAL)
+                    if not self._config_watcher.has_changed():
+                        continue
+                else:
+                    await changed.wait()
+                    # Editors write in several steps, let them finish
+                    await asyncio.sleep(CONFIG_SETTLE_TIME)
+                    self._config_watcher.has_changed()
+                    changed.clear()
+                self.apply_config(reload_config())
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+            self._config_watcher.close()
+
+    async def _shutdown(self):
+        """Stop watching config.ini and shut the display down."""
+        if self._config_task is not None:
+            self._config_task.cancel()
+        for task in self._service_tasks:
+            task.cancel()
+        get_snapshot_store().remove_listener(self._on_snapshot)
+        if len(self._service_tasks) > 0:
+            stats = get_http_client().get_stats()
+            logger.info(
+                "[Clock] %s HTTP requests, %s connections reused",
+                stats['requests'], stats['reused']
+            )
+        await self._display.shutdown()
+
+    def _on_snapshot(self, name):
+        """Wake the clock to draw the new data of a service."""
+        logger.debug("[Clock] New %s data", name)
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        """Wake the clock to redraw the frame now."""
+        self._dirty.set()
+
+    async def _sleep_until(self, deadline):
+        """Sleep until the deadline or until the clock is marked dirty."""
+        timeout = max(deadline - time.time(), 0)
+        logger.debug("[Clock] Sleeping for %.2fs", timeout)
+        try:
+            await asyncio.wait_for(self._dirty.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._dirty.clear()
+
     # Main Clock Function
     async def run_clock(self):
-        """Async function to run the clock. Sleeps for 0.33 seconds to allow for cli."""
+        """Async function to run the clock.
+            Sleeps until the next panel, background or service change is due,
+            or until a CLI command or new service data marks the clock dirty.
+            Frames are sent by the display pipeline, so drawing continues while the panel is busy."""
         try:
             await asyncio.sleep(1)
             logger.info("[Clock] BEGIN")
-            self._epd_driver.init()
-            self._epd_driver.clear()
+            await self._display.call(self._epd_driver.init)
+            await self._display.call(self._epd_driver.clear)
             logger.debug("[Clock] Starting Clock...")
-            self._epd_driver.set_screen(self._frame.get_image())
+            await self._display.call(self._epd_driver.set_screen, self._frame.get_image().copy())
+            loop = asyncio.get_running_loop()
+            self._config_task = loop.create_task(self._watch_config())
+            get_snapshot_store().add_listener(self._on_snapshot)
+            for service in self._frame.get_services():
+                # Fresh data cached before a restart is drawn without waiting on a request
+                service.restore()
+            self._service_tasks = [
+                loop.create_task(service.run()) for service in self._frame.get_services()
+            ]
             while True:
-                image, changes = self._frame.draw()
+                image, changes, regions = self._frame.draw()
+                deadline = self._epd_driver.get_next_refresh()
+                next_change = self._frame.get_next_change()
+                if next_change is not None:
+                    deadline = min(deadline, next_change)
+                self._epd_driver.set_next_update(deadline)
                 if image is None:
-                    self._epd_driver.update_screen(image)
-                    await asyncio.sleep(0.33)
+                    self._display.submit()
                 else:
                     logger.info(
                         "[Clock] Updating screen, %s change%s:",
@@ -81,24 +214,26 @@ class Clock():
                     )
                     for change in changes:
                         logger.info("[Clock] %s",change)
-                    self._epd_driver.update_screen(image)
+                    # A full redraw has no regions, send the whole frame
+                    self._display.submit(image, None if regions is None else union_regions(regions))
+                await self._sleep_until(deadline)
         except IOError as e:
             logger.error("\tIOError")
             logger.error(e)
-            self._epd_driver.shutdown()
+            await self._shutdown()
             exit(1)
 
         except asyncio.CancelledError:
             logger.debug("Cancelled")
-            self._epd_driver.shutdown()
+            await self._shutdown()
             exit()
 
         except KeyboardInterrupt:
             print()
-            self._epd_driver.shutdown()
+            await self._shutdown()
             exit()
 
         except SystemExit:
             logger.debug("System Exit")
-            self._epd_driver.shutdown()
+            await self._shutdown()
             exit()
@@ -1,14 +1,22 @@
 """Config Parser Module"""
 import configparser
 import dataclasses
+import functools
+import io
+import json
 import logging
+import os
 from secrets import token_hex
 
-from constants import InfoTypes, BannerTypes, VerticalAlignment, HorizontalAlignment
+from constants import InfoTypes, BannerTypes, VerticalAlignment, HorizontalAlignment, DitherMethods
 from image_helper import check_image_path
+from inotify_helper import Inotify
 
 logger = logging.getLogger()
 
+# Sections built by Config, by attribute name
+SECTIONS = ("logging", "frame", "display", "http", "fonts", "textbox", "weather", "fitbit")
+
 def get_config_item(config, group, key):
     """Returns the value of the key in the group"""
     try:
@@ -20,26 +28,103 @@ def set_config_item(config, group, key, value):
     """Sets the value of the key in the group"""
     try:
         config[group][key] = value
-        config.write(open("config.ini", "w"))
     except KeyError as exc:
         raise KeyError(f"Key {key} not found in group {group}") from exc
+    buffer = io.StringIO()
+    config.write(buffer)
+    write_file_atomic("config.ini", buffer.getvalue())
+
+def write_file_atomic(path, text):
+    """Writes the text to a temporary file then renames it over path,
+        so a crash leaves either the old or the new file"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+class TokenStore:
+    """Class to persist API tokens in a JSON state file.
+        Tokens are read from memory and every update is a single atomic write."""
+    def __init__(self, path):
+        self._path = path
+        self._tokens = None
+        try:
+            with open(path, encoding="utf-8") as file:
+                self._tokens = json.load(file)
+        except FileNotFoundError:
+            logger.debug("[CONFIG] No token file at %s", path)
+        except ValueError:
+            logger.error("[CONFIG] Token file %s is not valid JSON, ignoring it", path)
+
+    def get_tokens(self):
+        """Returns the stored tokens, None if there are none"""
+        if self._tokens is None:
+            return None
+        return dict(self._tokens)
+
+    def set_tokens(self, tokens):
+        """Stores the tokens"""
+        self._tokens = dict(tokens)
+        write_file_atomic(self._path, json.dumps(self._tokens, indent=4))
 
 # Configuration Constants
 @dataclasses.dataclass
 class Config:
-    """Class to hold the configuration of the program"""
+    """Class to hold the configuration of the program.
+        config.ini is parsed once, each section is built the first time it is used."""
     def __init__(self, path="config.ini"):
         try:
-            config = configparser.ConfigParser()
+            config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
             config.read(path)
         except Exception as exc:
             raise FileNotFoundError(f"Config file not found at {path}") from exc
+        self._config = config
 
         self.prog = get_config_item(config,"DEFAULT","NAME")
         self.version = get_config_item(config,"DEFAULT","VERSION")
         self.author = get_config_item(config,"DEFAULT","AUTHOR")
-        self.logging = LoggingConfig(config)
-        self.frame = FrameConfig(config)
+
+    @functools.cached_property
+    def logging(self):
+        """Returns the logging configuration"""
+        return LoggingConfig(self._config)
+
+    @functools.cached_property
+    def frame(self):
+        """Returns the frame configuration"""
+        return FrameConfig(self._config)
+
+    @functools.cached_property
+    def display(self):
+        """Returns the display configuration"""
+        return DisplayConfig(self._config)
+
+    @functools.cached_property
+    def http(self):
+        """Returns the HTTP client configuration"""
+        return HttpConfig(self._config)
+
+    @functools.cached_property
+    def fonts(self):
+        """Returns the font configuration"""
+        return FontConfig(self._config)
+
+    @functools.cached_property
+    def textbox(self):
+        """Returns the text box configuration"""
+        return TextBoxConfig(self._config)
+
+    @functools.cached_property
+    def weather(self):
+        """Returns the weather configuration"""
+        return WeatherConfig(self._config)
+
+    @functools.cached_property
+    def fitbit(self):
+        """Returns the fitbit configuration"""
+        return FitbitConfig(self._config)
 
 @dataclasses.dataclass
 class LoggingConfig:
@@ -61,6 +146,10 @@ class FrameConfig:
         elif check_image_path(filename):
             self.default_background = filename
         self.slide_interval = int(get_config_item(config,"FRAME","SLIDE_INTERVAL"))
+        self.dither = DitherMethods[get_config_item(config,"FRAME","DITHER")]
+        self.background_cache_size = int(get_config_item(config,"FRAME","BACKGROUND_CACHE_SIZE"))
+        directory = get_config_item(config,"FRAME","BACKGROUND_CACHE_DIR")
+        self.background_cache_dir = directory if directory != "" else None
 
         self.clock_dimensions = tuple(map(
             int, get_config_item(config,"FRAME","CLOCK_DIMENSIONS").split(",")
@@ -73,54 +162,72 @@ class FrameConfig:
         panels = get_config_item(config,"FRAME","BANNERS_ENABLED").split(",")
         self.banners = [BannerTypes[item] for item in panels]
 
+@dataclasses.dataclass
+class DisplayConfig:
+    """Class to hold the display configuration"""
+    def __init__(self, config):
+        self.sleep_threshold = int(get_config_item(config,"DISPLAY","SLEEP_THRESHOLD"))
+
+@dataclasses.dataclass
+class HttpConfig:
+    """Class to hold the HTTP client configuration"""
+    def __init__(self, config):
+        self.pool_size = int(get_config_item(config,"HTTP","POOL_SIZE"))
+        self.timeout = float(get_config_item(config,"HTTP","TIMEOUT"))
+        directory = get_config_item(config,"HTTP","CACHE_DIR")
+        self.cache_dir = directory if directory != "" else None
+
+@dataclasses.dataclass
+class FontConfig:
+    """Class to hold the font configuration"""
+    def __init__(self, config):
+        self.preload_sizes = [
+            int(size) for size in get_config_item(config,"FONTS","PRELOAD_SIZES").split(",")
+        ]
+        self.cache_size = int(get_config_item(config,"FONTS","CACHE_SIZE"))
+
 @dataclasses.dataclass
 class WeatherConfig:
     """Class to hold the weather configuration"""
-    def __init__(self):
-        try:
-            config = configparser.ConfigParser()
-            config.read("config.ini")
-        except Exception as exc:
-            raise FileNotFoundError("Config file not found") from exc
+    def __init__(self, config):
         self.api_key = get_config_item(config,"WEATHER","API_KEY")
         self.api_urls = get_config_item(config,"WEATHER","API_URL").split(" ")
         self.api_refresh_interval = int(get_config_item(config,"WEATHER","REFRESH_INTERVAL"))
-        self.city = get_config_item(config,"WEATHER","CITY")
+        self.locations = get_config_item(config,"WEATHER","CITY").split("|")
+        self.city = self.locations[0]
+        self.forecast_days = int(get_config_item(config,"WEATHER","FORECAST_DAYS"))
         self.units = get_config_item(config,"WEATHER","UNITS")
 
 @dataclasses.dataclass
 class TextBoxConfig:
     """Class to hold the text box configuration"""
-    def __init__(self):
-        try:
-            config = configparser.ConfigParser()
-            config.read("config.ini")
-        except Exception as exc:
-            raise FileNotFoundError("Config file not found") from exc
+    def __init__(self, config):
         self.text = get_config_item(config,"TEXTBOX","TEXT")
 
 @dataclasses.dataclass
 class FitbitConfig:
     """Class to hold the fitbit configuration"""
-    def __init__(self):
-        try:
-            config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
-            config.read("config.ini")
-        except Exception as exc:
-            raise FileNotFoundError("Config file not found") from exc
+    def __init__(self, config):
+        self._config = config
         self.api_client_id = get_config_item(config,"FITBIT","API_CLIENT_ID")
         self.api_secret = get_config_item(config,"FITBIT","API_SECRET")
         self.api_urls = get_config_item(config,"FITBIT","API_URL").split(" ")
         self.api_refresh_interval = int(get_config_item(config,"FITBIT","REFRESH_INTERVAL"))
         self.api_key = get_config_item(config,"FITBIT","API_KEY")
-        self.api_access_token = get_config_item(config,"FITBIT","API_ACCESS_TOKEN")
-        self.api_refresh_token = get_config_item(config,"FITBIT","API_REFRESH_TOKEN")
-        expiry = get_config_item(config,"FITBIT","API_EXPIRY")
-        if expiry == "":
-            self.api_expiry = 0
-        else:
-            self.api_expiry = float(get_config_item(config,"FITBIT","API_EXPIRY"))
-        self.user_id = get_config_item(config,"FITBIT","USER_ID")
+        self._token_store = TokenStore(get_config_item(config,"FITBIT","TOKEN_FILE"))
+        tokens = self._token_store.get_tokens()
+        if tokens is None:
+            # Tokens saved in config.ini by older versions
+            tokens = {
+                "access_token": config["FITBIT"].get("API_ACCESS_TOKEN", ""),
+                "refresh_token": config["FITBIT"].get("API_REFRESH_TOKEN", ""),
+                "expiry": float(config["FITBIT"].get("API_EXPIRY", "") or 0),
+                "user_id": config["FITBIT"].get("USER_ID", "")
+            }
+        self.api_access_token = tokens["access_token"]
+        self.api_refresh_token = tokens["refresh_token"]
+        self.api_expiry = float(tokens["expiry"])
+        self.user_id = tokens["user_id"]
         self.units = get_config_item(config,"FITBIT","UNITS")
         self.scope = get_config_item(config,"FITBIT","API_SCOPE")
         try:
@@ -136,26 +243,98 @@ class FitbitConfig:
     
     def set_tokens(self, access_token, refresh_token, expiry, user_id):
         """Sets the access token and refresh token"""
-        try:
-            config = configparser.ConfigParser()
-            config.read("config.ini")
-        except Exception as exc:
-            raise FileNotFoundError("Config file not found") from exc
         self.api_access_token = access_token
         self.api_refresh_token = refresh_token
-        self.api_expiry = expiry
+        self.api_expiry = float(expiry)
         self.user_id = user_id
-        if expiry is not str:
-            expiry = str(expiry)
-        set_config_item(config,"FITBIT","API_ACCESS_TOKEN",access_token)
-        set_config_item(config,"FITBIT","API_REFRESH_TOKEN",refresh_token)
-        set_config_item(config,"FITBIT","API_EXPIRY",expiry)
-        set_config_item(config,"FITBIT","USER_ID",user_id)
+        self._token_store.set_tokens({
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "expiry": self.api_expiry,
+            "user_id": user_id
+        })
+
+def _get_values(config):
+    """Returns the value of every key of a parsed config by (section, key)"""
+    values = {}
+    for section in [config.default_section] + config.sections():
+        for key in config[section]:
+            if section != config.default_section and key in config.defaults():
+                continue
+            values[(section, key)] = config[section].get(key)
+    return values
+
+def diff_config(old, new):
+    """Returns the (section, key) pairs added, removed or changed between two parsed configs"""
+    old_values = _get_values(old)
+    new_values = _get_values(new)
+    return {
+        item for item in old_values.keys() | new_values.keys()
+        if old_values.get(item) != new_values.get(item)
+    }
+
+class ConfigWatcher:
+    """Class to watch the config file for changes.
+        The folder is watched with inotify so editors that replace the file are seen,
+        where inotify is not available the modification time of the file is checked."""
+    def __init__(self, path="config.ini"):
+        self._path = os.path.abspath(path)
+        self._mtime = self._get_mtime()
+        self._inotify = Inotify.create()
+        if self._inotify is not None and not self._inotify.add_watch(os.path.dirname(self._path)):
+            self._inotify.close()
+            self._inotify = None
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self._path).st_mtime_ns
+        except OSError:
+            return None
+
+    def fileno(self):
+        """Returns the inotify file descriptor, None if the file has to be polled"""
+        if self._inotify is None:
+            return None
+        return self._inotify.fileno()
+
+    def has_changed(self):
+        """Returns True if the file changed since the last call"""
+        if self._inotify is not None:
+            name = os.path.basename(self._path)
+            return any(event[2] == name for event in self._inotify.read_events())
+        mtime = self._get_mtime()
+        changed = mtime != self._mtime
+        self._mtime = mtime
+        return changed
+
+    def close(self):
+        """Stops watching the file"""
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
 
 _CONFIG = Config()
-_TEXTBOX_CONFIG = TextBoxConfig()
-_WEATHER_CONFIG = WeatherConfig()
-_FITBIT_CONFIG = FitbitConfig()
+
+def reload_config(path="config.ini"):
+    """Parses the config file again and makes it the loaded configuration.
+        Sections with no changed keys keep their objects.
+        Returns the changed (section, key) pairs, none if the new file is invalid."""
+    global _CONFIG
+    try:
+        config = Config(path)
+        changes = diff_config(_CONFIG._config, config._config)
+        changed_sections = {section.lower() for section, _ in changes}
+        for name in SECTIONS:
+            if name in changed_sections:
+                # Build the section now so invalid values are caught before it is used
+                getattr(config, name)
+            elif name in _CONFIG.__dict__:
+                config.__dict__[name] = _CONFIG.__dict__[name]
+    except (configparser.Error, KeyError, ValueError, OSError) as e:
+        logger.error("[CONFIG] Not reloading %s: %s", path, e)
+        return set()
+    _CONFIG = config
+    return changes
 
 def get_config():
     """Returns the currently loaded configuration"""
@@ -163,12 +342,12 @@ def get_config():
 
 def get_textbox_config():
     """Returns the currently loaded textbox configuration"""
-    return _TEXTBOX_CONFIG
+    return _CONFIG.textbox
 
 def get_weather_config():
     """Returns the currently loaded weather configuration"""
-    return _WEATHER_CONFIG
+    return _CONFIG.weather
 
 def get_fitbit_config():
     """Returns the currently loaded fitbit configuration"""
-    return _FITBIT_CONFIG
+    return _CONFIG.fitbit
@@ -6,6 +6,9 @@ class InfoTypes(Enum):
     """Enum for the different types of panels that can be displayed on the Info Panel"""
     TEXT = "text"
     WEATHER = "weather"
+    FORECAST = "forecast"
+    DATE = "date"
+    FITBIT = "fitbit"
 
 class BannerTypes(Enum):
     """Enum for the different types of panels that can be displayed on the Banner Panel"""
@@ -16,6 +19,12 @@ class VerticalAlignment(Enum):
     TOP = 0
     BOTTOM = 1
 
+class DitherMethods(Enum):
+    """Enum for the methods of converting background images to black and white"""
+    FLOYD_STEINBERG = "floyd-steinberg"
+    BAYER = "bayer"
+    THRESHOLD = "threshold"
+
 class HorizontalAlignment(Enum):
     """Enum for Horizontal Alignment of the Clock Panel"""
     LEFT = 0
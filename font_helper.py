@@ -0,0 +1,47 @@
+"""Helper functions for fonts.
+    Fonts are parsed once and shared by every panel, least recently used first out."""
+import logging
+import os
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+from config import get_config
+from image_helper import picdir
+
+logger = logging.getLogger()
+
+DEFAULT_FONT = os.path.join(picdir, 'Font.ttc')
+
+_FONTS = OrderedDict()
+
+def _get_cache_size():
+    """Return the number of fonts kept, from config."""
+    return get_config().fonts.cache_size
+
+def get_font(size, path=DEFAULT_FONT, index=0):
+    """Return the font at the size, loading it if it is not cached."""
+    key = (path, size, index)
+    font = _FONTS.get(key)
+    if font is not None:
+        _FONTS.move_to_end(key)
+        return font
+    logger.debug("[Fonts] Loading %s at size %s", os.path.basename(path), size)
+    font = ImageFont.truetype(path, size, index=index)
+    _FONTS[key] = font
+    while len(_FONTS) > max(_get_cache_size(), 1):
+        evicted, _ = _FONTS.popitem(last=False)
+        logger.debug("[Fonts] Evicted %s at size %s", os.path.basename(evicted[0]), evicted[1])
+    return font
+
+def preload_fonts(sizes=None, path=DEFAULT_FONT, index=0):
+    """Load the font at each size, the sizes in config by default."""
+    if sizes is None:
+        sizes = get_config().fonts.preload_sizes
+    for size in sizes:
+        get_font(size, path, index)
+    logger.debug("[Fonts] Preloaded sizes %s", ", ".join(str(size) for size in sizes))
+
+def clear_fonts():
+    """Drop every cached font."""
+    _FONTS.clear()
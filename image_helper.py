@@ -1,8 +1,36 @@
 """Helper functions for images."""
+import hashlib
 import logging
 import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageChops
+
+from constants import DitherMethods
+from inotify_helper import (
+    Inotify, IN_DELETE, IN_DELETE_SELF, IN_ISDIR, IN_MOVED_FROM, IN_Q_OVERFLOW
+)
 
 logger = logging.getLogger()
+
+# Background image formats
+IMAGE_EXTENSIONS = (".bmp", ".png", ".jpg", ".jpeg", ".webp")
+
+# 4x4 Bayer matrix, scaled to 0-255 thresholds
+BAYER_4 = (
+    (0, 8, 2, 10),
+    (12, 4, 14, 6),
+    (3, 11, 1, 9),
+    (15, 7, 13, 5)
+)
+
+# Decoded icons kept in memory
+MAX_ICONS = 32
+
+# Folders of /pic/ holding icons rather than backgrounds
+ICON_FOLDERS = ("weather", "fitbit")
+
 #Images
 picdir = os.path.join(
     os.path.dirname(
@@ -17,28 +45,254 @@ def get_image_path(filename):
 
 def check_image_path(filename):
     """Check if the image path is valid.
-        - Must be a .bmp file
+        - Must be a .bmp, .png, .jpg, .jpeg or .webp file
         - Must exist in the /pic/ directory"""
-    if not filename.endswith(".bmp"):
-        logger.error("File must be a .bmp file")
-        raise ValueError("File must be a .bmp file")
+    if not filename.lower().endswith(IMAGE_EXTENSIONS):
+        logger.error("File must be one of %s", ", ".join(IMAGE_EXTENSIONS))
+        raise ValueError(f"File must be one of {', '.join(IMAGE_EXTENSIONS)}")
     if not os.path.exists(get_image_path(filename)):
         logger.error("File not found at pic/%s",filename)
         raise FileNotFoundError()
     return True
 
 def get_all_images():
-    """Return a list of all images in the /pic/ directory"""
-    return [f for f in os.listdir(picdir) if f.endswith(".bmp")]
+    """Return a list of all images in the /pic/ directory and its folders"""
+    return get_image_index().get_images()
+
+def get_file_digest(path):
+    """Return the sha256 hex digest of the contents of the file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _bayer_thresholds(size):
+    """Return an L image of the size tiled with the inverted Bayer thresholds."""
+    tile = Image.new('L', (4, 4))
+    tile.putdata([255 - (value * 16 + 8) for row in BAYER_4 for value in row])
+    thresholds = Image.new('L', size)
+    for y in range(0, size[1], 4):
+        for x in range(0, size[0], 4):
+            thresholds.paste(tile, (x, y))
+    return thresholds
+
+def convert_to_1bit(image, method=DitherMethods.FLOYD_STEINBERG):
+    """Convert an image to black and white with the dither method.
+        Transparent pixels are treated as white."""
+    if image.mode == '1':
+        return image
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    image = image.convert('L')
+    if method == DitherMethods.THRESHOLD:
+        return image.point(lambda value: 255 if value >= 128 else 0, '1')
+    if method == DitherMethods.BAYER:
+        # Adding the inverted threshold saturates at 255 only where the pixel is above it
+        image = ImageChops.add(image, _bayer_thresholds(image.size))
+        return image.point(lambda value: 255 if value == 255 else 0, '1')
+    return image.convert('1')
+
+class IconStore:
+    """Class to hold the icons in the /pic/ icon folders.
+        The folders are indexed once, icons are decoded on first use and kept
+        resized and converted, least recently used first out."""
+    def __init__(self, folders, max_icons=MAX_ICONS):
+        self._max_icons = max_icons
+        self._index = {}
+        for folder in folders:
+            path = os.path.join(picdir, folder)
+            names = os.listdir(path) if os.path.isdir(path) else []
+            self._index[folder] = {
+                name[:-len(".bmp")]: os.path.join(path, name)
+                for name in names if name.endswith(".bmp")
+            }
+        self._icons = OrderedDict()
+
+    def get_path(self, folder, icon):
+        """Return the full path of the icon, None if it does not exist."""
+        return self._index.get(folder, {}).get(icon)
+
+    def get_icon(self, folder, icon, size=None, mode='1'):
+        """Return the icon image resized to size and converted to mode, None if it does not exist."""
+        key = (folder, icon, size, mode)
+        image = self._icons.get(key)
+        if image is not None:
+            self._icons.move_to_end(key)
+            return image
+        path = self.get_path(folder, icon)
+        if path is None:
+            return None
+        with Image.open(path) as source:
+            image = source.resize(size) if size is not None else source.copy()
+        if image.mode != mode:
+            image = image.convert(mode)
+        self._icons[key] = image
+        while len(self._icons) > self._max_icons:
+            self._icons.popitem(last=False)
+        return image
+
+_ICONS = IconStore(ICON_FOLDERS)
+
+class ImageEntry:
+    """Class to hold the metadata of an indexed image."""
+    __slots__ = ("path", "size", "mtime", "_digest")
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+        self._digest = None
+
+    def get_digest(self):
+        """Return the sha256 of the image contents, hashed once."""
+        if self._digest is None:
+            self._digest = get_file_digest(self.path)
+        return self._digest
+
+class ImageIndex:
+    """Class to index the background images in /pic/ and its folders, icon folders excluded.
+        The directory is scanned on first use and then kept up to date from inotify events,
+        or where inotify is not available by rescanning folders whose mtime changed."""
+    def __init__(self, root, recursive=True):
+        self._root = root
+        self._recursive = recursive
+        self._lock = threading.Lock()
+        self._entries = None
+        self._images = None
+        self._folders = {}
+        self._inotify = None
+
+    def _is_image(self, name):
+        return name.lower().endswith(IMAGE_EXTENSIONS)
+
+    def _relative(self, path):
+        return os.path.relpath(path, self._root).replace(os.sep, "/")
+
+    def _scan_folder(self, folder):
+        """Index the images of a folder and, if recursive, the folders below it."""
+        try:
+            self._folders[folder] = os.stat(folder).st_mtime_ns
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            logger.warning("[ImageIndex] Could not scan %s: %s", folder, e)
+            return
+        if self._inotify is not None:
+            self._inotify.add_watch(folder)
+        for entry in entries:
+            if entry.is_dir():
+                if (self._recursive and not entry.name.startswith(".")
+                        and not (folder == self._root and entry.name in ICON_FOLDERS)):
+                    self._scan_folder(entry.path)
+            elif self._is_image(entry.name):
+                self._add_file(entry.path)
+
+    def _add_file(self, path):
+        try:
+            self._entries[self._relative(path)] = ImageEntry(path, os.stat(path))
+        except OSError:
+            self._remove(path)
+        self._images = None
+
+    def _remove(self, path):
+        """Remove a file or a whole folder from the index."""
+        relative = self._relative(path)
+        self._entries.pop(relative, None)
+        prefix = relative + "/"
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+        for folder in [folder for folder in self._folders if folder == path or folder.startswith(path + os.sep)]:
+            del self._folders[folder]
+        self._images = None
+
+    def _full_scan(self):
+        self._entries = {}
+        self._folders = {}
+        self._images = None
+        self._scan_folder(self._root)
+        logger.debug("[ImageIndex] Indexed %d images", len(self._entries))
+
+    def _refresh(self):
+        """Scan on first use, then apply the changes since the last call."""
+        if self._entries is None:
+            self._inotify = Inotify.create()
+            if self._inotify is None:
+                logger.debug("[ImageIndex] inotify not available, checking folder mtimes")
+            self._full_scan()
+            return
+        if self._inotify is None:
+            changed = []
+            for folder, mtime in list(self._folders.items()):
+                try:
+                    if os.stat(folder).st_mtime_ns != mtime:
+                        changed.append(folder)
+                except OSError:
+                    changed.append(folder)
+            if changed:
+                self._full_scan()
+            return
+        for folder, mask, name in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW or folder is None:
+                self._full_scan()
+                return
+            if mask & IN_DELETE_SELF or name == "":
+                continue
+            path = os.path.join(folder, name)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._remove(path)
+            elif mask & IN_ISDIR:
+                if (self._recursive and not name.startswith(".")
+                        and not (folder == self._root and name in ICON_FOLDERS)):
+                    self._scan_folder(path)
+            elif self._is_image(name):
+                self._add_file(path)
+
+    def get_images(self):
+        """Return the sorted names of the indexed images, relative to /pic/."""
+        with self._lock:
+            self._refresh()
+            if self._images is None:
+                self._images = sorted(self._entries)
+            return self._images
+
+    def get_entry(self, filename):
+        """Return the metadata of an image, None if it is not indexed."""
+        with self._lock:
+            self._refresh()
+            return self._entries.get(filename)
+
+_IMAGE_INDEX = ImageIndex(picdir)
+
+def get_image_index():
+    """Return the index of the images in /pic/."""
+    return _IMAGE_INDEX
 
 def get_weather_icon(icon):
     """Return the full path of the weather icon."""
-    if os.path.exists(os.path.join(picdir, "weather", f"{icon}.bmp")):
-        return os.path.join(picdir, "weather", f"{icon}.bmp")
-    logger.error("Weather icon %s not found", icon)
+    path = _ICONS.get_path("weather", icon)
+    if path is None:
+        logger.error("Weather icon %s not found", icon)
+    return path
 
 def get_fitbit_icon(icon):
     """Return the full path of the fitbit icon."""
-    if os.path.exists(os.path.join(picdir, "fitbit", f"{icon}.bmp")):
-        return os.path.join(picdir, "fitbit", f"{icon}.bmp")
-    logger.error("Fitbit icon %s not found", icon)
\ No newline at end of file
+    path = _ICONS.get_path("fitbit", icon)
+    if path is None:
+        logger.error("Fitbit icon %s not found", icon)
+    return path
+
+def get_weather_icon_image(icon, size=None):
+    """Return the weather icon as a 1 bit image resized to size, None if it does not exist."""
+    image = _ICONS.get_icon("weather", icon, size)
+    if image is None:
+        logger.error("Weather icon %s not found", icon)
+    return image
+
+def get_fitbit_icon_image(icon, size=None):
+    """Return the fitbit icon as a 1 bit image resized to size, None if it does not exist."""
+    image = _ICONS.get_icon("fitbit", icon, size)
+    if image is None:
+        logger.error("Fitbit icon %s not found", icon)
+    return image
\ No newline at end of file
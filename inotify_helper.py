@@ -0,0 +1,78 @@
+"""Helper for watching files with inotify."""
+import ctypes
+import ctypes.util
+import os
+import struct
+
+# inotify events watched, from <sys/inotify.h>
+IN_ATTRIB = 0x0004
+IN_CLOSE_WRITE = 0x0008
+IN_MOVED_FROM = 0x0040
+IN_MOVED_TO = 0x0080
+IN_CREATE = 0x0100
+IN_DELETE = 0x0200
+IN_DELETE_SELF = 0x0400
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = (
+    IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class Inotify:
+    """Minimal inotify binding through libc, None from create() where it is not available."""
+    def __init__(self, libc, fd):
+        self._libc = libc
+        self._fd = fd
+        self._watches = {}
+
+    @classmethod
+    def create(cls):
+        """Return an inotify instance, None if the platform has no inotify."""
+        name = ctypes.util.find_library("c")
+        if name is None:
+            return None
+        try:
+            libc = ctypes.CDLL(name, use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def add_watch(self, directory):
+        """Watch a directory, returns False if it could not be watched."""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            return False
+        self._watches[wd] = directory
+        return True
+
+    def read_events(self):
+        """Return the pending (directory, mask, name) events without blocking."""
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_DELETE_SELF:
+                    self._watches.pop(wd, None)
+                events.append((self._watches.get(wd), mask, name))
+
+    def fileno(self):
+        """Return the file descriptor, readable when events are pending."""
+        return self._fd
+
+    def close(self):
+        """Stop watching."""
+        os.close(self._fd)
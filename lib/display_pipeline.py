@@ -0,0 +1,89 @@
+"""Async interface to the EPD driver.
+    All driver calls run on a single worker thread which owns the SPI bus,
+    so the event loop and the CLI keep running while the panel is busy."""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.frame_builder.compositor import union_regions
+
+logger = logging.getLogger()
+
+class DisplayPipeline:
+    """DisplayPipeline class, queues frames for the EPD driver.
+        The queue holds at most one pending frame, a newer frame replaces it
+        and its region is merged so the stale frame's changes are still sent."""
+    def __init__(self, epd_driver):
+        self._epd_driver = epd_driver
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="EPD")
+        self._pending = None
+        self._worker = None
+        self._frames_sent = 0
+        self._frames_dropped = 0
+
+    def get_stats(self):
+        """Return the number of frames sent and dropped as stale."""
+        return {'sent': self._frames_sent, 'dropped': self._frames_dropped}
+
+    async def call(self, func, *args):
+        """Run a driver function on the worker thread and return its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def submit(self, image=None, region=None):
+        """Queue a frame for the display, returns immediately.
+            A frame without an image only lets the driver check for a due refresh.
+            Raises the error of the last frame sent if it failed."""
+        if self._worker is not None and self._worker.done():
+            worker = self._worker
+            self._worker = None
+            worker.result()
+        if image is None:
+            if self._pending is None and not self.is_busy():
+                self._pending = (None, None)
+        else:
+            # The frame image is drawn over in place, send a copy
+            image = image.copy()
+            if self._pending is not None and self._pending[0] is not None:
+                self._frames_dropped += 1
+                logger.debug("[DisplayPipeline] Replacing a stale frame")
+                if region is not None and self._pending[1] is not None:
+                    region = union_regions([self._pending[1], region])
+                else:
+                    region = None
+            self._pending = (image, region)
+        if self._pending is not None and not self.is_busy():
+            self._worker = asyncio.get_running_loop().create_task(self._drain())
+
+    def is_busy(self):
+        """Return True while frames are being sent to the display."""
+        return self._worker is not None and not self._worker.done()
+
+    async def _drain(self):
+        """Send the pending frames until the queue is empty."""
+        while self._pending is not None:
+            image, region = self._pending
+            self._pending = None
+            await self.call(self._epd_driver.update_screen, image, region)
+            if image is not None:
+                self._frames_sent += 1
+
+    async def flush(self):
+        """Wait until the queued frames have been sent."""
+        if self._worker is not None:
+            await self._worker
+
+    async def shutdown(self):
+        """Drop any pending frame, wait for the frame being sent then shut the display down."""
+        self._pending = None
+        if self.is_busy():
+            try:
+                await self._worker
+            except Exception as e:
+                logger.error("[DisplayPipeline] Last frame failed: %s", e)
+        await self.call(self._epd_driver.shutdown)
+        self._executor.shutdown(wait=True)
+        logger.info(
+            "[DisplayPipeline] %s frames sent, %s stale frames dropped",
+            self._frames_sent, self._frames_dropped
+        )
@@ -2,12 +2,65 @@
 import logging
 import time
 
-from lib.waveshare_epd import epd2in13_V4
+from lib.waveshare_epd import epd2in13_V4, epdbuffer
+
+from config import get_config
 
 logger = logging.getLogger()
 
 REFRESH_TIME = 43200
 
+class PowerManager:
+    """Class to track the power state of the display controller.
+        The controller is kept awake between updates that are less than
+        sleep_threshold seconds apart, skipping the init and sleep around each one."""
+    def __init__(self, sleep_threshold):
+        self._sleep_threshold = sleep_threshold
+        self._awake = False
+        self._next_update = None
+        self._costs = {'init': None, 'sleep': None}
+        self._skipped = {'init': 0, 'sleep': 0}
+        self._saved = 0.0
+
+    def set_sleep_threshold(self, sleep_threshold):
+        """Set the gap between updates, in seconds, above which the controller sleeps."""
+        self._sleep_threshold = sleep_threshold
+
+    def is_awake(self):
+        """Return True if the controller is initialised and not in deep sleep."""
+        return self._awake
+
+    def set_next_update(self, next_update):
+        """Set the time the next update is expected, None if unknown."""
+        self._next_update = next_update
+
+    def should_sleep(self):
+        """Return True if the next update is too far away to keep the controller awake."""
+        if self._next_update is None:
+            return True
+        return self._next_update - time.time() > self._sleep_threshold
+
+    def record(self, name, duration=None):
+        """Record an init or sleep that was performed and how long it took."""
+        if duration is not None:
+            self._costs[name] = duration
+        self._awake = name == 'init'
+
+    def skip(self, name):
+        """Record an init or sleep that was skipped, returns the time saved."""
+        self._skipped[name] += 1
+        saved = self._costs[name] or 0.0
+        self._saved += saved
+        return saved
+
+    def get_stats(self):
+        """Return the skipped init and sleep counts and the total time saved in seconds."""
+        return {
+            'init_skipped': self._skipped['init'],
+            'sleep_skipped': self._skipped['sleep'],
+            'saved': self._saved
+        }
+
 class EPDDriver:
     """Class to handle the e-Paper display."""
     def __init__(self):
@@ -20,15 +73,24 @@ class EPDDriver:
         self._last_refresh = time.time()
         self._partial_updates = 0
         self._image = None
+        self._buffer = None
+        self._frames_skipped = 0
+        self._power = PowerManager(get_config().display.sleep_threshold)
 
     def get_dimensions(self):
         """Return the dimensions of the display."""
         return (self._epd.height, self._epd.width)
 
+    def set_sleep_threshold(self, sleep_threshold):
+        """Set the gap between updates, in seconds, above which the display sleeps."""
+        self._power.set_sleep_threshold(sleep_threshold)
+
     def init(self):
         """Send the initialise command to the display."""
         logger.debug("[epd2in13_V4] Initialising the display...")
+        start = time.monotonic()
         self._epd.init()
+        self._power.record('init', time.monotonic() - start)
 
     def clear(self):
         """Send the clear command to the display."""
@@ -38,7 +100,35 @@ class EPDDriver:
     def sleep(self):
         """Send the sleep command to the display."""
         logger.debug("[epd2in13_V4] Sending sleep command to the display...")
+        start = time.monotonic()
         self._epd.sleep()
+        self._power.record('sleep', time.monotonic() - start)
+
+    def wake(self):
+        """Initialise the display unless it is still awake from the last update."""
+        if not self._power.is_awake():
+            self.init()
+            return
+        saved = self._power.skip('init')
+        logger.debug("[epd2in13_V4] Display still awake, skipped init saving %.2fs", saved)
+
+    def rest(self):
+        """Put the display to sleep unless the next update is due soon."""
+        if not self._power.is_awake():
+            return
+        if self._power.should_sleep():
+            self.sleep()
+            return
+        saved = self._power.skip('sleep')
+        logger.debug("[epd2in13_V4] Next update due soon, skipped sleep saving %.2fs", saved)
+
+    def set_next_update(self, next_update):
+        """Set the time the next update is expected, used to decide whether to sleep."""
+        self._power.set_next_update(next_update)
+
+    def get_power_stats(self):
+        """Return the init and sleep cycles skipped and the time saved."""
+        return self._power.get_stats()
 
     def set_screen(self, image):
         """Set the screen to the frame image."""
@@ -50,36 +140,95 @@ class EPDDriver:
             self._epd.TurnOnDisplay()
         self._partial_updates = 0
         self._image = image
-        self._epd.displayPartBaseImage(self._epd.getbuffer(image))
+        self._buffer = self._epd.getbuffer(image)
+        self._epd.displayPartBaseImage(self._buffer)
+
+    def get_window(self, region):
+        """Map a region of the frame image to a window of the panel RAM.
+            The frame is landscape, the panel is portrait, so the axes swap.
+            The X axis of the window is widened to whole bytes."""
+        x_start, y_start, x_end, y_end = region
+        linewidth = (self._epd.width + 7) // 8
+        return (
+            y_start // 8 * 8,
+            self._epd.height - x_end,
+            min((y_end + 7) // 8, linewidth) * 8 - 1,
+            self._epd.height - x_start - 1
+        )
+
+    def get_next_refresh(self):
+        """Return the time the next full refresh of the screen is due."""
+        return self._last_refresh + REFRESH_TIME
 
-    def update_screen(self, image= None):
-        """Update the screen with the frame image."""
+    def get_diff_window(self, buffer):
+        """Return the window of the panel RAM where the buffer differs from the one displayed.
+            Returns None if they are identical."""
+        linewidth = (self._epd.width + 7) // 8
+        window = epdbuffer.diff_window(self._buffer, buffer, linewidth)
+        if window is None:
+            return None
+        x_start, y_start, x_end, y_end = window
+        return (x_start * 8, y_start, min(x_end * 8 + 7, self._epd.width - 1), y_end)
+
+    def limit_to_region(self, buffer, region):
+        """Return the displayed buffer with the rows of a region of the frame taken from buffer."""
+        linewidth = (self._epd.width + 7) // 8
+        _, first_row, _, last_row = self.get_window(region)
+        start = first_row * linewidth
+        end = (last_row + 1) * linewidth
+        return bytearray(self._buffer[:start]) + bytearray(buffer[start:end]) + bytearray(self._buffer[end:])
+
+    def update_screen(self, image= None, region=None):
+        """Update the screen with the frame image.
+            Only the window of the buffer that differs from the one displayed is sent,
+            nothing is sent if they are identical. The damaged region of the frame,
+            None if it was redrawn, limits the rows compared and sent."""
         if image is None and time.time() - self._last_refresh >= REFRESH_TIME:
             self.refresh_screen()
             return
         if image is None:
+            if self._power.is_awake() and self._power.should_sleep():
+                self.sleep()
             return
-        self.init()
+        buffer = self._epd.getbuffer(image)
+        window = None
+        if self._buffer is not None:
+            if region is not None:
+                buffer = self.limit_to_region(buffer, region)
+            window = self.get_diff_window(buffer)
+            if window is None:
+                self._frames_skipped += 1
+                logger.debug(
+                    "[epd2in13_V4] Frame identical to the screen, skipped (%s skipped)",
+                    self._frames_skipped
+                )
+                return
+        self.wake()
         if self._partial_updates > 6 or time.time() - self._last_refresh >= REFRESH_TIME:
             self.set_screen(image)
-            self.sleep()
+            self.rest()
         else:
             logger.debug("[epd2in13_V4] Updating screen...")
             self._epd.TurnOnDisplayPart()
-            self._epd.displayPartial(self._epd.getbuffer(image))
+            if window is None:
+                self._epd.displayPartial(buffer)
+            else:
+                logger.debug("[epd2in13_V4] Updating window %s of the screen", window)
+                self._epd.displayPartialWindow(buffer, *window)
             self._partial_updates += 1
             self._image = image
-            self.sleep()
+            self._buffer = buffer
+            self.rest()
 
     def refresh_screen(self):
         """Refresh the screen with the frame image."""
         logger.debug("[epd2in13_V4] Refreshing screen...")
-        self.init()
+        self.wake()
         self.clear()
         self._partial_updates += 1
         self.set_screen(self._image)
         self._last_refresh = time.time()
-        self.sleep()
+        self.rest()
 
     def shutdown(self):
         """Clear then sleep the display."""
@@ -87,4 +236,11 @@ class EPDDriver:
         self._epd.init()
         self._epd.Clear()
         self._epd.sleep()
+        self._buffer = None
+        self._power.record('sleep')
+        stats = self._power.get_stats()
+        logger.info(
+            "[epd2in13_V4] Skipped %s inits and %s sleeps, saving %.1fs",
+            stats['init_skipped'], stats['sleep_skipped'], stats['saved']
+        )
         logger.info("[epd2in13_V4] Display shutdown")
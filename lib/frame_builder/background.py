@@ -1,20 +1,32 @@
 """Class to represent background images."""
+import bisect
 import logging
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image, ImageOps
 
 from config import get_config
-from image_helper import check_image_path, get_image_path, get_all_images
+from image_helper import (
+    check_image_path, get_image_path, get_all_images, get_file_digest, convert_to_1bit,
+    get_image_index
+)
+from lib.frame_builder.background_cache import get_background_cache
 
 logger = logging.getLogger()
 
+# Prepares the next slideshow image off the render loop
+_PREFETCH = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Prefetch")
+
 class Background:
     """Class to represent background images."""
     def __init__(self, screen_dimensions):
         self._image = None
         self._drawn = True
         self._name = None
+        self._top = 0
+        self._bottom = 0
         self._slideshow = None
         self._screen_dimensions = screen_dimensions
 
@@ -25,21 +37,68 @@ class Background:
             return Image.new('1', self._screen_dimensions, 255)
         return self._image
 
+    def get_damage(self):
+        """Return the region of the background image changed by the last draw.
+            None means the whole background."""
+        return None
+
+    def get_next_change(self):
+        """Return now if the background has not been drawn, None if it only changes when set."""
+        if not self._drawn:
+            return time.time()
+        return None
+
     def set_image(self, filename, top, bottom):
-        """Set the background of the frame. Black and White, uncompressed BMP."""
+        """Set the background of the frame. BMP, PNG, JPEG or WebP, dithered to black and white."""
         if check_image_path(filename) is False:
             logger.error("Invalid image path: %s", filename)
             return
         self._name = filename
+        self._top = top
+        self._bottom = bottom
+        self._image = self._load(filename, top, bottom)
+        self._drawn = False
+
+    def reload(self):
+        """Prepare the current image again, after a setting used to prepare it changed."""
+        if self._name is not None:
+            self.set_image(self._name, self._top, self._bottom)
+
+    def _load(self, filename, top, bottom):
+        """Return the prepared image from the cache, preparing and caching it if needed."""
+        path = get_image_path(filename)
+        dither = get_config().frame.dither
+        entry = get_image_index().get_entry(filename)
+        mtime = entry.mtime if entry is not None else os.stat(path).st_mtime_ns
+        key = (filename, mtime, self._screen_dimensions, top, bottom, dither.value)
+        size = (self._screen_dimensions[0], self._screen_dimensions[1] - top - bottom)
+        cache = get_background_cache()
+        image = cache.get(key, size)
+        if image is not None:
+            return image
+        file_key = None
+        if cache.is_persistent():
+            digest = entry.get_digest() if entry is not None else get_file_digest(path)
+            file_key = (digest,) + key[2:]
+            image = cache.get(key, size, file_key)
+            if image is not None:
+                return image
+        logger.debug("[Background] Preparing pic/%s", filename)
+        return cache.put(key, self._prepare(path, top, bottom, dither), file_key)
+
+    def _prepare(self, path, top, bottom, dither):
+        """Return the image at path resized to the screen, cropped between top and bottom,
+            dithered to black and white and bordered."""
         border = (1,0,1,0)
-        image = Image.open(get_image_path(filename)).resize(self._screen_dimensions, Image.BICUBIC)
-        self._image=ImageOps.expand(
+        with Image.open(path) as source:
+            image = source.resize(self._screen_dimensions, Image.BICUBIC)
+        image = convert_to_1bit(
             image.crop(
                 (1, top, self._screen_dimensions[0] - 1, self._screen_dimensions[1] - bottom)
             ),
-            border=border
+            dither
         )
-        self._drawn = False
+        return ImageOps.expand(image, border=border, fill=0)
 
     def draw(self):
         """Draw the background image to the frame."""
@@ -55,26 +114,56 @@ class Slideshow(Background):
         super().__init__(screen_dimensions)
         self._top = top
         self._bottom = bottom
-        self._slideshow = []
-        self._current = 0
+        self._current = None
         self._last_change = None
-        for image in get_all_images():
-            self._slideshow.append(image)
-        logger.info("[Slideshow] %d images found.", len(self._slideshow))
+        self._prefetch = None
+        logger.info("[Slideshow] %d images found.", len(get_all_images()))
         self.draw()
 
+    def _get_next(self, filename):
+        """Return the image after filename in the slideshow, the first if filename is None.
+            The slideshow follows the image index, so added and removed images are picked up."""
+        images = get_all_images()
+        if len(images) == 0:
+            return None
+        if filename is None:
+            return images[0]
+        return images[bisect.bisect_right(images, filename) % len(images)]
+
+    def get_next_change(self):
+        """Return the time the next image of the slideshow is due."""
+        if len(get_all_images()) == 0:
+            return None
+        if self._last_change is None:
+            return time.time()
+        return self._last_change + get_config().frame.slide_interval
+
     def draw(self):
         """Move to the next image in the slideshow."""
         if self._last_change is not None:
             if time.time() - self._last_change < get_config().frame.slide_interval:
                 return None, None
-        if len(self._slideshow) == 0:
+        filename = self._get_next(self._current)
+        if filename is None:
             logger.warning("[Slideshow] No images in slideshow.")
             return None, None
-        if self._current < len(self._slideshow) - 1:
-            self._current += 1
-        else:
-            self._current = 0
+        self._current = filename
         self._last_change = time.time()
-        self.set_image(self._slideshow[self._current], self._top, self._bottom)
+        if self._prefetch is not None:
+            # Prefetching the image due now, wait rather than prepare it twice
+            try:
+                self._prefetch.result()
+            except Exception as e:
+                logger.warning("[Slideshow] Prefetch failed: %s", e)
+        self.set_image(self._current, self._top, self._bottom)
+        self._prefetch_next()
         return super().draw()
+
+    def _prefetch_next(self):
+        """Prepare the next image of the slideshow in the background."""
+        filename = self._get_next(self._current)
+        if filename is None or filename == self._current:
+            self._prefetch = None
+            return
+        logger.debug("[Slideshow] Prefetching pic/%s", filename)
+        self._prefetch = _PREFETCH.submit(self._load, filename, self._top, self._bottom)
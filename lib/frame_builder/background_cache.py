@@ -0,0 +1,91 @@
+""" This module is responsible for caching prepared background images.
+    Backgrounds are kept ready to paste in memory and optionally on disk as raw 1-bit files
+    named by the contents of the source image and how it was prepared."""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from config import get_config
+
+logger = logging.getLogger()
+
+class BackgroundCache:
+    """BackgroundCache class, holds prepared background images, least recently used first out.
+        Keys are (filename, mtime, dimensions, top, bottom, dither), a changed file gets a new key.
+        Files on disk are named from a file key instead, built from the contents of the source."""
+    def __init__(self, max_images, directory=None):
+        self._max_images = max_images
+        self._directory = directory
+        self._images = OrderedDict()
+        # Images are prepared on the prefetch thread too
+        self._lock = threading.Lock()
+        if self._directory:
+            os.makedirs(self._directory, exist_ok=True)
+
+    def is_persistent(self):
+        """Return True if images are also cached on disk."""
+        return bool(self._directory)
+
+    def _get_file(self, file_key):
+        """Return the path of the file holding the image for the file key."""
+        digest = hashlib.sha1(repr(file_key).encode()).hexdigest()
+        return os.path.join(self._directory, f"{digest}.bin")
+
+    def get(self, key, size, file_key=None):
+        """Return the cached image of the size for the key, None if it is not cached.
+            The disk is checked for the file key if the image is not in memory."""
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                return image
+        if not self._directory or file_key is None:
+            return None
+        try:
+            with open(self._get_file(file_key), "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        if len(data) != (size[0] + 7) // 8 * size[1]:
+            logger.warning("[BackgroundCache] Ignoring cached file of the wrong size for %s", key[0])
+            return None
+        image = Image.frombytes('1', size, data)
+        self._add(key, image)
+        return image
+
+    def put(self, key, image, file_key=None):
+        """Cache the image for the key, on disk under the file key too if a directory is set."""
+        if image.mode != '1':
+            image = image.convert('1')
+        self._add(key, image)
+        if not self._directory or file_key is None:
+            return image
+        path = self._get_file(file_key)
+        try:
+            with open(f"{path}.tmp", "wb") as file:
+                file.write(image.tobytes())
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning("[BackgroundCache] Could not write %s: %s", path, e)
+        return image
+
+    def _add(self, key, image):
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            while len(self._images) > self._max_images:
+                self._images.popitem(last=False)
+
+_BACKGROUND_CACHE = BackgroundCache(
+    get_config().frame.background_cache_size,
+    get_config().frame.background_cache_dir
+)
+
+def get_background_cache():
+    """Returns the background cache"""
+    return _BACKGROUND_CACHE
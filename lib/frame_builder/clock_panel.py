@@ -3,25 +3,55 @@
 import logging
 import time
 
+from lib.frame_builder.glyph_atlas import GlyphAtlas
 from lib.frame_builder.panel import Panel
 
 from config import get_config
 
 logger = logging.getLogger()
 
+CLOCK_CHARACTERS = "0123456789:"
+
 class ClockPanel(Panel):
-    """Clock Panel class, displays the current time."""
+    """Clock Panel class, displays the current time.
+        The time is drawn from cached glyphs and only the digits that change are redrawn."""
     def __init__(self, alignment):
         super().__init__(get_config().frame.clock_dimensions, alignment, "Clock",
                          time.strftime('%H:%M'), 32)
-        self._imagedraw.text((0,0), self._data, font = self._font, fill = 0)
+        self._next_change = (int(time.time()) // 60 + 1) * 60
+        self._damage = None
+        self._atlas = GlyphAtlas(self._font, CLOCK_CHARACTERS)
+        self._atlas.draw(self._image, (0,0), self._data)
+
+    def set_font(self, font):
+        """Set the font used by the panel and redraw the time with it."""
+        super().set_font(font)
+        self._atlas = GlyphAtlas(self._font, CLOCK_CHARACTERS)
+        self.reset_canvas()
+        self._atlas.draw(self._image, (0,0), self._data)
+        self._damage = None
+
+    def get_damage(self):
+        """Return the region of the digits changed by the last draw."""
+        return self._damage
+
+    def get_next_change(self):
+        """Return the start of the minute after the one displayed."""
+        return self._next_change
 
     # Draw the time on the image
     def draw(self):
         """Draw the clock panel image."""
-        if self._data == time.strftime('%H:%M'):
+        now = time.time()
+        data = time.strftime('%H:%M', time.localtime(now))
+        if self._data == data:
+            return None, None
+        previous = self._data
+        self._data = data
+        self._next_change = (int(now) // 60 + 1) * 60
+        # Clear inside the border only
+        clip = (1, 1, self._dimensions[0] - 1, self._dimensions[1] - 1)
+        self._damage = self._atlas.redraw(self._image, (0,0), previous, self._data, clip)
+        if self._damage is None:
             return None, None
-        self._data = time.strftime('%H:%M')
-        super().draw()
-        self._imagedraw.text((0,0), self._data, font = self._font, fill = 0)
         return self._image, f"Clock now displays {self._data}"
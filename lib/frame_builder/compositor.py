@@ -0,0 +1,76 @@
+""" This module is responsible for compositing panels onto the frame.
+    Panels are pasted straight into the display orientation and the damaged regions are tracked."""
+
+import logging
+
+from PIL import Image
+
+logger = logging.getLogger()
+
+def union_regions(regions):
+    """Return the smallest region containing all of the regions, None if there are none."""
+    regions = [region for region in regions if region is not None]
+    if len(regions) == 0:
+        return None
+    return (
+        min(region[0] for region in regions),
+        min(region[1] for region in regions),
+        max(region[2] for region in regions),
+        max(region[3] for region in regions)
+    )
+
+class Compositor:
+    """Compositor class, holds the frame image in display orientation.
+        The library displays upside down, so panels are rotated 180 as they are pasted."""
+    def __init__(self, dimensions):
+        self._dimensions = dimensions
+        self._image = Image.new('1', self._dimensions, 255)
+        self._damage = []
+
+    def get_image(self):
+        """Return the composited frame image."""
+        return self._image
+
+    def _map_region(self, region):
+        """Map a region from frame coordinates to display coordinates, clipped to the frame."""
+        x_start = max(self._dimensions[0] - region[2], 0)
+        y_start = max(self._dimensions[1] - region[3], 0)
+        x_end = min(self._dimensions[0] - region[0], self._dimensions[0])
+        y_end = min(self._dimensions[1] - region[1], self._dimensions[1])
+        return (x_start, y_start, x_end, y_end)
+
+    def paste(self, image, box, damage=None):
+        """Paste the image at box in frame coordinates.
+            damage is the region of the image that changed, defaults to the whole image."""
+        if damage is None:
+            damage = (0, 0, image.size[0], image.size[1])
+        region = (
+            box[0] + damage[0],
+            box[1] + damage[1],
+            box[0] + damage[2],
+            box[1] + damage[3]
+        )
+        x_start, y_start, x_end, y_end = self._map_region(region)
+        if x_start >= x_end or y_start >= y_end:
+            return None
+        # Convert before rotating so images needing dithering match an unrotated paste
+        if image.mode != self._image.mode:
+            image = image.convert(self._image.mode)
+        tile = image.crop(damage).rotate(180)
+        # Offset of the region within the tile, non-zero when the region is clipped to the frame
+        offset = (
+            self._dimensions[0] - region[2] - x_start,
+            self._dimensions[1] - region[3] - y_start
+        )
+        self._image.paste(
+            tile.crop((-offset[0], -offset[1], x_end - x_start - offset[0], y_end - y_start - offset[1])),
+            (x_start, y_start)
+        )
+        self._damage.append((x_start, y_start, x_end, y_end))
+        return self._damage[-1]
+
+    def get_damage(self):
+        """Return the damaged regions in display coordinates since the last call and reset them."""
+        damage = self._damage
+        self._damage = []
+        return damage
@@ -2,12 +2,13 @@
     Is used to display a white box with black border."""
 
 import logging
+import time
 
-from PIL import Image
-
+from config import get_config, get_textbox_config
 from constants import HorizontalAlignment, VerticalAlignment
 from lib.frame_builder.background import Background, Slideshow
 from lib.frame_builder.clock_panel import ClockPanel
+from lib.frame_builder.compositor import Compositor
 import lib.frame_builder.info_panel as InfoPanels
 import lib.frame_builder.banner_panel as BannerPanels
 
@@ -27,15 +28,16 @@ class Frame:
 
         #Base image to paste onto
         self._dimensions = dimensions
-        self._image = Image.new('1', self._dimensions, 255)
+        self._compositor = Compositor(self._dimensions)
 
         #Panels
         self._clock_panel = ClockPanel(self._alignment.alignment)
+        #The first enabled panel is the one shown
         self._info_panels = []
-        #self._info_panels.append(InfoPanels.WeatherPanel(self._dimensions,self._alignment.alignment))
-        self._info_panels.append(InfoPanels.FitbitPanel(self._dimensions,self._alignment.alignment))
-        self._info_panels.append(InfoPanels.TextPanel(self._dimensions,self._alignment.alignment))
-        self._info_panels.append(InfoPanels.DatePanel(self._dimensions,self._alignment.alignment))
+        for info_type in get_config().frame.infos:
+            panel = InfoPanels.get_info(info_type, self._dimensions, self._alignment.alignment)
+            if panel is not None:
+                self._info_panels.append(panel)
         self._banner_panels = []
         self._banner_panels.append(BannerPanels.BannerPanel(self._alignment.alignment))
 
@@ -69,7 +71,7 @@ class Frame:
         for panel in self._banner_panels:
             panel.set_vertical_alignment(alignment)
 
-        self._alignment.alignment = True
+        self._alignment.changed = True
 
     def set_horizontal_alignment(self, alignment):
         """Set the horizontal alignment of the clock in frame."""
@@ -94,6 +96,8 @@ class Frame:
             bottom = self._banner_panels[0].get_dimensions()[1]
             top = self._clock_panel.get_dimensions()[1]
         self._background = Slideshow(self._dimensions, top, bottom)
+        # The slideshow draws its first image when created
+        self._paste_background(True)
 
     def set_background(self, filename):
         """Set the background image of bmp in /pic/."""
@@ -113,6 +117,36 @@ class Frame:
         self._info_panels[0].set_text(text)
         return text
 
+    def apply_config(self, changes):
+        """Apply the changed (section, key) settings of config.ini to the frame,
+            its panels and their services. Only the parts affected are redrawn."""
+        config = get_config().frame
+        if (("FRAME", "v_alignment") in changes
+                and config.v_alignment != self._alignment.alignment[0]):
+            self.set_vertical_alignment(config.v_alignment)
+        if (("FRAME", "h_alignment") in changes
+                and config.h_alignment != self._alignment.alignment[1]):
+            self.set_horizontal_alignment(config.h_alignment)
+        if ("FRAME", "default_background") in changes:
+            if config.default_background is None:
+                self.set_background_slideshow()
+            else:
+                self.set_background(config.default_background)
+        elif ("FRAME", "dither") in changes:
+            self._background.reload()
+        if ("TEXTBOX", "text") in changes:
+            for panel in self._info_panels:
+                if isinstance(panel, InfoPanels.TextPanel):
+                    panel.set_text(get_textbox_config().text)
+        for panel in self._info_panels + self._banner_panels:
+            panel.apply_config(changes)
+
+    def get_services(self):
+        """Return the services of the panels shown."""
+        services = self._info_panels[0].get_services() + self._banner_panels[0].get_services()
+        # Panels may share a service, run each once
+        return list(dict.fromkeys(services))
+
     def get_info_panel_descriptions(self):
         """Return the descriptions of the info panels."""
         return [panel.getdescription() for panel in self._info_panels]
@@ -121,7 +155,7 @@ class Frame:
         """Return the descriptions of the banner panels."""
         return [panel.getdescription() for panel in self._banner_panels]
 
-    def _paste_background(self, image=None):
+    def _paste_background(self, whole=False):
         offset = 0
         if self._alignment.alignment[0] == VerticalAlignment.BOTTOM:
             offset = self._banner_panels[0].get_dimensions()[1]
@@ -131,12 +165,11 @@ class Frame:
             0,
             offset
         )
-        if image is None:
-            self._image.paste(self._background.get_image(), box)
-        else:
-            image.paste(self._background.get_image(), box)
+        return self._compositor.paste(
+            self._background.get_image(), box, None if whole else self._background.get_damage()
+        )
 
-    def _paste_clock(self, image=None):
+    def _paste_clock(self, whole=False):
         x_offset = 0
         y_offset = 0
         if self._alignment.alignment[1] == HorizontalAlignment.RIGHT:
@@ -147,12 +180,11 @@ class Frame:
             x_offset,
             y_offset
         )
-        if image is None:
-            self._image.paste(self._clock_panel.get_image(), box)
-        else:
-            image.paste(self._clock_panel.get_image(), box)
+        return self._compositor.paste(
+            self._clock_panel.get_image(), box, None if whole else self._clock_panel.get_damage()
+        )
 
-    def _paste_info_panel(self, image=None):
+    def _paste_info_panel(self, whole=False):
         #TODO: Get the current panel
         current_info_panel = self._info_panels[0]
         x_offset = 0
@@ -165,12 +197,11 @@ class Frame:
             x_offset,
             y_offset
         )
-        if image is None:
-            self._image.paste(current_info_panel.get_image(), box)
-        else:
-            image.paste(current_info_panel.get_image(), box)
+        return self._compositor.paste(
+            current_info_panel.get_image(), box, None if whole else current_info_panel.get_damage()
+        )
 
-    def _paste_banner_panel(self, image=None):
+    def _paste_banner_panel(self, whole=False):
         #TODO: Get the current panel
         current_banner_panel = self._banner_panels[0]
         y_offset = 0
@@ -180,56 +211,67 @@ class Frame:
             0,
             y_offset
         )
-        if image is None:
-            self._image.paste(current_banner_panel.get_image(), box)
-        else:
-            image.paste(current_banner_panel.get_image(), box)
+        return self._compositor.paste(
+            current_banner_panel.get_image(), box, None if whole else current_banner_panel.get_damage()
+        )
 
     def draw(self, override=False):
-        """Draw the frame. Returns None if nothing has changed."""
+        """Draw the frame. Returns None if nothing has changed.
+            Returns the image, the changes and the damaged regions in display coordinates.
+            The damaged regions are None if the whole frame was redrawn."""
         if(override or self._alignment.changed):
             if self._alignment.changed :
                 self._alignment.changed = False
                 logger.debug("[Frame] Alignment changed. Redrawing the screen, no panels updated.")
             else:
                 logger.debug("[Frame] Override set. Redrawing the screen, no panels updated.")
-            self._paste_background()
-            self._paste_clock()
-            self._paste_info_panel()
-            self._paste_banner_panel()
-            self._image = self._image.rotate(180)
-            return self._image, ["Frame has been redrawn."]
-        ##Library displays upside down, so rotate 180
-        frame = self._image.rotate(180)
+            self._paste_background(True)
+            self._paste_clock(True)
+            self._paste_info_panel(True)
+            self._paste_banner_panel(True)
+            self._compositor.get_damage()
+            return self._compositor.get_image(), ["Frame has been redrawn."], None
         changes = []
         background_image, change = self._background.draw()
         if background_image is not None:
             changes.append(f"Background has changed. {change}")
-            self._paste_background(frame)
+            self._paste_background()
 
         clock_image, change = self._clock_panel.draw()
         if clock_image is not None:
             changes.append(f"Clock has changed. {change}")
-            self._paste_clock(frame)
+            self._paste_clock()
 
         info_image, change = self._info_panels[0].draw()
         if info_image is not None:
             changes.append(f"Info Panel has changed. {change}")
-            self._paste_info_panel(frame)
+            self._paste_info_panel()
 
         banner_image, change = self._banner_panels[0].draw()
         if banner_image is not None:
             changes.append(f"Banner Panel has changed. {change}")
-            self._paste_banner_panel(frame)
+            self._paste_banner_panel()
+
+        regions = self._compositor.get_damage()
+        if len(regions) > 0:
+            return self._compositor.get_image(), changes, regions
+        return None, None, None
 
-        ##Library displays upside down, so rotate 180
-        if(clock_image is not None or background_image is not None or
-           info_image is not None or banner_image is not None):
-            frame = frame.rotate(180)
-            self._image = frame
-            return self._image, changes
-        return None, None
+    def get_next_change(self):
+        """Return the earliest time a part of the frame needs drawing, None if nothing is due."""
+        if self._alignment.changed:
+            return time.time()
+        deadlines = [
+            self._background.get_next_change(),
+            self._clock_panel.get_next_change(),
+            self._info_panels[0].get_next_change(),
+            self._banner_panels[0].get_next_change()
+        ]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        if len(deadlines) == 0:
+            return None
+        return min(deadlines)
 
     def get_image(self):
         """Return the image of the frame."""
-        return self._image
+        return self._compositor.get_image()
@@ -0,0 +1,109 @@
+""" This module is responsible for caching rendered glyphs.
+    Text made of the cached characters is drawn by pasting 1-bit glyph masks
+    instead of rendering it through FreeType each time."""
+
+import logging
+
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger()
+
+# Text layouts kept, enough for every HH:MM
+MAX_LAYOUTS = 2048
+
+def _union(first, second):
+    """Return the smallest box containing both boxes, either may be None."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return (
+        min(first[0], second[0]),
+        min(first[1], second[1]),
+        max(first[2], second[2]),
+        max(first[3], second[3])
+    )
+
+class GlyphAtlas:
+    """GlyphAtlas class, holds a mask of each character rendered in a font.
+        Characters are placed at their advance width, as ImageDraw.text places them."""
+    def __init__(self, font, characters):
+        self._font = font
+        self._glyphs = {}
+        self._layouts = {}
+        for character in characters:
+            bbox = font.getbbox(character)
+            # Ink left of or above the origin is kept by offsetting the mask
+            offset = (min(bbox[0], 0), min(bbox[1], 0))
+            mask = Image.new('1', (max(bbox[2] - offset[0], 1), max(bbox[3] - offset[1], 1)), 0)
+            ImageDraw.Draw(mask).text((-offset[0], -offset[1]), character, font=font, fill=255)
+            self._glyphs[character] = (mask, bbox, offset)
+        logger.debug("[GlyphAtlas] Rendered %d glyphs at size %s", len(self._glyphs), font.size)
+
+    def has_glyphs(self, text):
+        """Return True if every character of the text is in the atlas."""
+        return all(character in self._glyphs for character in text)
+
+    def _layout(self, text, origin):
+        """Return the position of each character of the text."""
+        advances = self._layouts.get(text)
+        if advances is None:
+            if len(self._layouts) >= MAX_LAYOUTS:
+                self._layouts.clear()
+            advances = [self._font.getlength(text[:index]) for index in range(len(text))]
+            self._layouts[text] = advances
+        return [(round(origin[0] + advance), origin[1]) for advance in advances]
+
+    def _ink_box(self, character, position):
+        """Return the box of the ink of a character drawn at position."""
+        bbox = self._glyphs[character][1]
+        return (
+            position[0] + bbox[0],
+            position[1] + bbox[1],
+            position[0] + bbox[2],
+            position[1] + bbox[3]
+        )
+
+    def _paste(self, image, character, position, fill):
+        """Paste the glyph of a character onto the image at position."""
+        mask, _, offset = self._glyphs[character]
+        image.paste(fill, (position[0] + offset[0], position[1] + offset[1]), mask)
+
+    def draw(self, image, origin, text, fill=0):
+        """Paste the glyphs of the text onto the image at origin."""
+        for character, position in zip(text, self._layout(text, origin)):
+            self._paste(image, character, position, fill)
+
+    def redraw(self, image, origin, previous, text, clip, background=255, fill=0):
+        """Replace the previous text drawn at origin with the text, only redrawing the
+            characters that changed. Clearing is limited to the clip box.
+            Returns the box of the image that changed, None if nothing did."""
+        previous_layout = self._layout(previous, origin)
+        layout = self._layout(text, origin)
+        damage = None
+        for index, (character, position) in enumerate(zip(text, layout)):
+            if (index < len(previous)
+                    and previous[index] == character and previous_layout[index] == position):
+                continue
+            damage = _union(damage, self._ink_box(character, position))
+            if index < len(previous):
+                damage = _union(damage, self._ink_box(previous[index], previous_layout[index]))
+        for index in range(len(text), len(previous)):
+            damage = _union(damage, self._ink_box(previous[index], previous_layout[index]))
+        if damage is None:
+            return None
+        damage = (
+            max(damage[0], clip[0]),
+            max(damage[1], clip[1]),
+            min(damage[2], clip[2]),
+            min(damage[3], clip[3])
+        )
+        if damage[0] >= damage[2] or damage[1] >= damage[3]:
+            return None
+        image.paste(background, damage)
+        # Glyphs overlapping the cleared box are pasted again whole, pixels outside it are unchanged
+        for character, position in zip(text, layout):
+            box = self._ink_box(character, position)
+            if box[0] < damage[2] and box[2] > damage[0] and box[1] < damage[3] and box[3] > damage[1]:
+                self._paste(image, character, position, fill)
+        return damage
@@ -3,14 +3,15 @@
 import logging
 import time
 
-from PIL import Image,ImageOps,ImageFont
+from PIL import Image,ImageOps
 
 from config import get_config, get_textbox_config
 from constants import HorizontalAlignment, InfoTypes
-from image_helper import get_weather_icon, get_fitbit_icon
+from font_helper import get_font
+from image_helper import get_weather_icon_image, get_fitbit_icon_image
 from lib.frame_builder.service_panel import ServicePanel
-from lib.services.weather_api import WeatherService
-from lib.services.fitbit_api import FitbitService
+from lib.services.weather_api import WeatherRecord, get_weather_service
+from lib.services.fitbit_api import FitbitService, FitbitRecord
 
 logger = logging.getLogger()
 
@@ -18,15 +19,18 @@ def get_info_types():
     """Returns a dictionary of InfoPanel child classes."""
     return {
         InfoTypes.TEXT: TextPanel,
-        InfoTypes.WEATHER: WeatherPanel
+        InfoTypes.WEATHER: WeatherPanel,
+        InfoTypes.FORECAST: ForecastPanel,
+        InfoTypes.DATE: DatePanel,
+        InfoTypes.FITBIT: FitbitPanel
     }
 
-def get_info(panel_type=None, screendimensions=None):
-    """Returns an InfoPanel child class based on the panelType."""
+def get_info(panel_type=None, screendimensions=None, alignment=None):
+    """Returns an InfoPanel child class based on the panelType, None if it is not recognised."""
     return get_info_types().get(
         panel_type,
-        lambda args: logger.debug("panel_type [%s] not recognised. Ignoring Panel.", panel_type)
-    )(screendimensions)
+        lambda *args: logger.debug("panel_type [%s] not recognised. Ignoring Panel.", panel_type)
+    )(screendimensions, alignment)
 
 ##Class for Panels next to the time
 class InfoPanel(ServicePanel):
@@ -82,6 +86,13 @@ class DatePanel(InfoPanel):
         self._imagedraw.text((26,3), self._data, font = self._font, fill = 0)
         self._latest_change = f"Date now displays {self._data}"
 
+    def get_next_change(self):
+        """Return the next midnight, now if the date has not been drawn yet."""
+        if not self._drawn or self._last_refresh is None:
+            return time.time()
+        now = time.localtime()
+        return time.mktime((now.tm_year, now.tm_mon, now.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
     def update(self):
         if (self._last_refresh is None or self._data != time.strftime(DATE_FORMAT)):
             self._data = time.strftime(DATE_FORMAT)
@@ -90,52 +101,39 @@ class DatePanel(InfoPanel):
 
 class WeatherPanel(InfoPanel):
     """Class for panels that display the weather."""
-    def __init__(self, screen_dimensions, alignment, logname="Weather", fontsize=18):
-        super().__init__(screen_dimensions, alignment, WeatherService(), logname, fontsize)
+    def __init__(self, screen_dimensions, alignment, logname="Weather", fontsize=18, location=None):
+        # Drawing starts in the constructor, the location is needed by then
+        self._location = location
+        super().__init__(screen_dimensions, alignment, get_weather_service(), logname, fontsize)
         self._description = "This panel is used to display the weather."
 
-    def _update(self):
-        self._last_refresh = time.time()
-        response = self._service.get_data()
-        if response is None:
-            self._drawn = True
-            return
-        if isinstance(self._data, dict):
-            if self._data["icon"] != response["icon"]:
-                self._data["icon"] = response["icon"]
-                self._drawn = False
-            if self._data["temp"] != response["temp"]:
-                self._data["temp"] = response["temp"]
-                self._drawn = False
-            if self._data["description"] != response["conditions"]:
-                self._data["description"] = response["conditions"]
-                self._drawn = False
-        else:
+    def _update(self, response):
+        location = self._location or self._service.locations[0]
+        record = response.locations.get(location)
+        if record is not None and self._data != record:
+            self._data = record
             self._drawn = False
-            self._data = dict()
-            self._data["icon"] = response["icon"]
-            self._data["temp"] = response["temp"]
-            self._data["description"] = response["conditions"]
 
     def _draw(self):
-        if isinstance(self._data, dict):
+        if isinstance(self._data, WeatherRecord):
             self._draw_temp()
             self._draw_conditions()
             self._paste_icon()
-            self._latest_change = f"Weather now displays {self._convert_temp(self._data['temp'])} and {self._data['description']}"
+            self._latest_change = f"Weather now displays {self._convert_temp(self._data.temp)} and {self._data.conditions}"
         else:
             self._imagedraw.text((4,4), 'loading...', font = self._font, fill = 0)
     
     def _paste_icon(self):
         """Paste the weather icon onto the image."""
         #Get the weather icon folder in pic
-        icon = Image.open(get_weather_icon(self._data["icon"]))
-        self._image.paste(icon, (2,2))
+        icon = get_weather_icon_image(self._data.icon)
+        if icon is not None:
+            self._image.paste(icon, (2,2))
 
     def _draw_temp(self):
         """Draw the temperature on the image."""
-        temp = self._convert_temp(self._data["temp"])
-        font = ImageFont.truetype(self._font.path, 26)
+        temp = self._convert_temp(self._data.temp)
+        font = get_font(26, self._font.path, self._font.index)
         self._imagedraw.text((32,2), temp[0:4], font = font, fill = 0)
         self._imagedraw.text((88,2), temp[4::1], font = self._font, fill = 0)
 
@@ -143,8 +141,8 @@ class WeatherPanel(InfoPanel):
         """Draw the weather conditions on the image."""
         ##need to truncate text if too long
         #how too long?
-        font = ImageFont.truetype(self._font.path, 14)
-        self._imagedraw.text((84,16), self._data["description"], font = font, fill = 0)
+        font = get_font(14, self._font.path, self._font.index)
+        self._imagedraw.text((84,16), self._data.conditions, font = font, fill = 0)
 
     def _convert_temp(self, temp):
         """Convert the temperature to the correct units."""
@@ -152,6 +150,38 @@ class WeatherPanel(InfoPanel):
             return f"{str(temp)[0:4]}°F"
         return f"{str(float(temp - 32) * 5 / 9)[0:4]}°C"
 
+class ForecastPanel(WeatherPanel):
+    """Class for panels that display the weather forecast of the next days."""
+    def __init__(self, screen_dimensions, alignment, logname="Forecast", fontsize=12, location=None):
+        super().__init__(screen_dimensions, alignment, logname, fontsize, location)
+        self._description = "This panel is used to display the weather forecast."
+
+    def _draw(self):
+        if not isinstance(self._data, WeatherRecord) or len(self._data.forecast) == 0:
+            self._imagedraw.text((4,4), 'loading...', font = self._font, fill = 0)
+            return
+        width = (self._dimensions[0] - 2) // len(self._data.forecast)
+        for index, day in enumerate(self._data.forecast):
+            self._draw_day(day, 2 + index * width)
+        self._latest_change = f"Forecast now displays {len(self._data.forecast)} days"
+
+    def _draw_day(self, day, x):
+        """Draw the icon, weekday and temperatures of a forecast day in a column starting at x."""
+        icon = get_weather_icon_image(day.icon, (16,16))
+        if icon is not None:
+            self._image.paste(icon, (x,2))
+        weekday = time.strftime("%a", time.strptime(day.date, "%Y-%m-%d"))
+        self._imagedraw.text((x+18,3), weekday, font = self._font, fill = 0)
+        high = self._convert_degrees(day.temp_max)
+        low = self._convert_degrees(day.temp_min)
+        self._imagedraw.text((x,19), f"{high}/{low}°", font = self._font, fill = 0)
+
+    def _convert_degrees(self, temp):
+        """Convert the temperature to whole degrees in the correct units."""
+        if self._service.units == "imperial":
+            return round(temp)
+        return round((temp - 32) * 5 / 9)
+
 ##GMAIL PANEL (UNREAD EMAILS (UNREAD IMPORTANT), (TOTAL OF) MULTI-ACCOUNT SUPPORT)
 
 class FitbitPanel(InfoPanel):
@@ -160,30 +190,28 @@ class FitbitPanel(InfoPanel):
         super().__init__(screen_dimensions, alignment, FitbitService(), logname=logname, fontsize=fontsize)
         self._description = "This panel is used to display fitbit steps."
 
-    def _update(self):
-        self._last_refresh = time.time()
-        response = self._service.get_data()
-        if response is not None:
-            if self._data is not None or self._data['summary']['steps'] != response['summary']['steps']:
-                self._drawn = False
+    def _update(self, response):
+        if self._data != response:
             self._data = response
-            
+            self._drawn = False
+
 
     def _draw(self):
-        if self._data is None:
+        if not isinstance(self._data, FitbitRecord):
             self._imagedraw.text((4,4), 'loading...', font = self._font, fill = 0)
             return
         self._draw_icon()
-        self._draw_steps(self._data['summary']['steps'],self._data['goals']['steps'])
-        self._latest_change = f"Fitbit now displays {self._data['summary']['steps']}/{self._data['goals']['steps']} steps"
+        self._draw_steps(self._data.steps, self._data.goal)
+        self._latest_change = f"Fitbit now displays {self._data.steps}/{self._data.goal} steps"
 
     def _draw_icon(self):
         """Draw the fitbit icon on the image."""
-        icon = Image.open(get_fitbit_icon("steps")).resize((24,24))
-        self._image.paste(icon, (3,6))
+        icon = get_fitbit_icon_image("steps", (24,24))
+        if icon is not None:
+            self._image.paste(icon, (3,6))
 
     def _draw_steps(self, actual, goal):
         """Draw the steps on the image."""
         self._imagedraw.text((32,-3), f"{actual:06}", font = self._font, fill = 0)
-        font = ImageFont.truetype(self._font.path, 12)
+        font = get_font(12, self._font.path, self._font.index)
         self._imagedraw.text((112,21), f"of {goal}", font = font, fill = 0)
\ No newline at end of file
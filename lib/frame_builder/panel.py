@@ -2,11 +2,10 @@
     Is used to display a white box with black border."""
 
 import logging
-import os
 
-from PIL import Image,ImageDraw,ImageFont, ImageOps
+from PIL import Image,ImageDraw, ImageOps
 
-from image_helper import picdir
+from font_helper import get_font
 
 logger = logging.getLogger()
 
@@ -15,7 +14,7 @@ class Panel:
     """Panel class, displays a box with 1px border."""
     def __init__(self, dimensions, alignment, logname = "Base",
                  data= "loading...", fontsize=24):
-        self._font = ImageFont.truetype(os.path.join(picdir, 'Font.ttc'), fontsize)
+        self._font = get_font(fontsize)
         self._alignment = alignment
         self._dimensions = dimensions
         self._image = self._image_factory()
@@ -45,6 +44,18 @@ class Panel:
         """Return the dimensions of the panel."""
         return self._dimensions
 
+    def get_damage(self):
+        """Return the region of the panel image changed by the last draw.
+            None means the whole panel."""
+        return None
+
+    def get_next_change(self):
+        """Return the time the panel next needs drawing, None if it only changes when told to."""
+        return None
+
+    def apply_config(self, changes):
+        """Apply the changed (section, key) settings of config.ini to the panel."""
+
     def set_vertical_alignment(self, alignment):
         """Set the vertical alignment of the panel."""
         self._alignment = (
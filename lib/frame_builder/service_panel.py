@@ -16,6 +16,7 @@ class ServicePanel(Panel):
         self._drawn = False
         self._latest_change = None
         self._last_refresh = None
+        self._version = None
         self._description = "This description is given when the panels command is called."
         self._service = service
         super().draw()
@@ -33,18 +34,39 @@ class ServicePanel(Panel):
     def _draw(self):
         pass
 
-    def update(self):
-        """Updates the panel."""
+    def get_next_change(self):
+        """Return now if the panel has changes to draw, None otherwise.
+            New service data wakes the clock when it is published."""
+        if not self._drawn:
+            return time.time()
+        return None
+
+    def get_services(self):
+        """Return the services the panel reads from."""
+        if self._service is None:
+            return []
+        return [self._service]
+
+    def apply_config(self, changes):
+        """Apply the changed settings to the service, requesting and drawing again if they affect it."""
         if self._service is None:
             return
-        if self._last_refresh is None:
-            self._update()
+        if self._service.apply_config(changes):
+            self._service.wake()
+            self._drawn = False
+
+    def update(self):
+        """Updates the panel from the latest snapshot of the service, without waiting on it."""
+        if self._service is None:
             return
-        if time.time() - self._last_refresh < self._service.api_refresh_interval:
+        snapshot = self._service.get_snapshot()
+        if snapshot is None or snapshot.version == self._version:
             return
-        self._update()
+        self._version = snapshot.version
+        self._last_refresh = snapshot.time
+        self._update(snapshot.data)
 
-    def _update(self):
+    def _update(self, response):
         pass
 
     def get_description(self):
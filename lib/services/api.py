@@ -1,23 +1,288 @@
 """Dataclass for API services"""
+import asyncio
+import hashlib
+import logging
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import get_config
+from lib.services.response_cache import CachedResponse, get_response_cache
+from lib.services.snapshot_store import get_snapshot_store
+
+logger = logging.getLogger()
+
+# Requests block, they run here rather than on the event loop
+_FETCH = ThreadPoolExecutor(max_workers=2, thread_name_prefix="Fetch")
+
+# Seconds to wait after the first failed request, doubled for each failure after it
+BACKOFF_BASE = 30
+BACKOFF_MAX = 900
+# Failures in a row that open the circuit, seconds it stays open before a trial request
+# and the most seconds of jitter added on top of that
+CIRCUIT_THRESHOLD = 5
+CIRCUIT_TIMEOUT = 1800
+CIRCUIT_JITTER = 60
+
+class HTTPClient:
+    """HTTPClient class, a session shared by the services.
+        Connections are pooled per host and kept alive between refreshes,
+        so a refresh skips the DNS lookup, TCP connect and TLS handshake."""
+    def __init__(self, pool_size):
+        self._session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+        self._session.headers["Accept-Encoding"] = "gzip, deflate"
+
+    def request(self, method, url, **kwargs):
+        """Sends a request, with the timeout in config unless one is given."""
+        kwargs.setdefault("timeout", get_config().http.timeout)
+        return self._session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Sends a GET request."""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Sends a POST request."""
+        return self.request("POST", url, **kwargs)
+
+    def get_stats(self):
+        """Returns the number of requests sent, connections opened and connections reused."""
+        pools = self._adapter.poolmanager.pools
+        sent = 0
+        opened = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                sent += pool.num_requests
+                opened += pool.num_connections
+        return {'requests': sent, 'connections': opened, 'reused': sent - opened}
+
+    def close(self):
+        """Closes the pooled connections."""
+        self._session.close()
+
+_HTTP_CLIENT = None
+
+def get_http_client():
+    """Returns the HTTP client shared by the services,
+        created by the first one so the HTTP section is only read when it is used."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = HTTPClient(get_config().http.pool_size)
+    return _HTTP_CLIENT
 
 class APIService:
-    """Dataclass for API services."""
-    def __init__(self, api_key, api_urls, api_refresh_interval):
+    """Dataclass for API services.
+        Subclasses set record_type to the ServiceRecord their data is kept as."""
+    record_type = None
+
+    def __init__(self, api_key, api_urls, api_refresh_interval, name="API"):
+        self.name = name
         self.api_key = api_key
         self.api_urls = api_urls
         self.api_refresh_interval = api_refresh_interval
         self.api_last_refresh = None
+        self._http = get_http_client()
+        self._wake = None
+        self._cached = get_response_cache().load(name)
+        self._validators = None
+        self._failures = 0
+        self._retry_at = None
+        self._circuit_open = False
+
+    def restore(self):
+        """Publishes the cached data of the service if it is still fresh,
+            so it is shown at start up without waiting on a request."""
+        data = self._get_cached_data()
+        if data is None:
+            return False
+        age = time.time() - self._cached.time
+        if age < 0 or age >= self.api_refresh_interval:
+            return False
+        logger.info("[%s] Using the data requested %ds ago", self.name, age)
+        self.api_last_refresh = self._cached.time
+        get_snapshot_store().publish(self.name, data)
+        return True
+
+    def get_cache_tag(self):
+        """Returns a description of the settings the data depends on.
+            Cached data saved with other settings is not restored."""
+        return " ".join(self.api_urls)
 
     def get_data(self):
-        """Returns the data from the API."""
-        if self.api_last_refresh is None:
-            self.api_last_refresh = time.time()
-            return self._request()
-        if time.time() - self.api_last_refresh < self.api_refresh_interval:
+        """Returns the data from the API, None if it is not due or the request failed."""
+        if self.get_next_refresh() > time.time():
             return None
         self.api_last_refresh = time.time()
-        return self._request()
+        try:
+            data = self._request()
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            logger.error("[%s] Request failed: %s", self.name, e)
+            data = None
+        if data is None:
+            self._validators = None
+            self._record_failure()
+            return None
+        self._record_success()
+        return self._cache(data)
+
+    def _record_failure(self):
+        """Backs off after a failed request, with jitter so services do not retry together.
+            Too many failures in a row open the circuit, pausing requests for longer."""
+        self._failures += 1
+        if self._failures >= CIRCUIT_THRESHOLD:
+            if not self._circuit_open:
+                logger.warning(
+                    "[%s] %d failed requests in a row, pausing requests for %ds",
+                    self.name, self._failures, CIRCUIT_TIMEOUT
+                )
+            self._circuit_open = True
+            # The pause is never shortened, the jitter only adds to it
+            delay = CIRCUIT_TIMEOUT + random.uniform(0, CIRCUIT_JITTER)
+        else:
+            delay = min(BACKOFF_BASE * 2 ** (self._failures - 1), BACKOFF_MAX)
+            delay = random.uniform(delay / 2, delay)
+        self._retry_at = time.time() + delay
+        logger.debug("[%s] Retrying in %ds", self.name, self._retry_at - time.time())
+
+    def _record_success(self):
+        """Closes the circuit after a successful request."""
+        if self._circuit_open:
+            logger.info("[%s] Requests succeeding again", self.name)
+        self._failures = 0
+        self._retry_at = None
+        self._circuit_open = False
+
+    def is_failing(self):
+        """Returns True if the last request failed."""
+        return self._failures > 0
+
+    def reset(self):
+        """Requests again as soon as possible, forgetting any failures."""
+        self.api_last_refresh = None
+        self._failures = 0
+        self._retry_at = None
+        self._circuit_open = False
+
+    def _serve_stale(self):
+        """Publishes the cached data, however old, if nothing has been published yet."""
+        if get_snapshot_store().get(self.name) is not None:
+            return
+        data = self._get_cached_data()
+        if data is None:
+            return
+        logger.info(
+            "[%s] Service unavailable, using the data requested %ds ago",
+            self.name, time.time() - self._cached.time
+        )
+        get_snapshot_store().publish(self.name, data)
+
+    def _get_cached_data(self):
+        """Returns the record of the cached data, None if there is none
+            or it was saved with other settings."""
+        cached = self._cached
+        if cached is None or cached.data is None or cached.tag != self.get_cache_tag():
+            return None
+        try:
+            return self.record_type(**cached.data)
+        except (KeyError, TypeError):
+            return None
+
+    def _cache(self, data):
+        """Saves the data with the validators of the response it came from, returns the data."""
+        validators = self._validators
+        self._validators = None
+        if validators is None:
+            validators = (None, None, None)
+        self._cached = CachedResponse(
+            self.api_last_refresh, data.to_dict(), self.get_cache_tag(), *validators
+        )
+        get_response_cache().save(self.name, self._cached)
+        return data
+
+    def _get_json(self, url, conditional=True, **kwargs):
+        """Sends a GET request and returns the response and its JSON, parsed once.
+            Unless conditional is False the request is conditional on the cached response
+            to the same request, if that was saved with the current settings,
+            the JSON is None when the server answers 304 Not Modified
+            and the cached data from _get_cached_data is still current."""
+        prepared = requests.Request("GET", url, params=kwargs.get("params")).prepare()
+        request = hashlib.sha256(prepared.url.encode()).hexdigest()
+        headers = dict(kwargs.pop("headers", None) or {})
+        cached = self._cached
+        # Settings outside the URL, such as the forecast days, change the tag but not the request,
+        # a 304 would then leave nothing usable to serve
+        if (conditional and cached is not None
+                and cached.request == request and self._get_cached_data() is not None):
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        else:
+            cached = None
+        response = self._http.get(url, headers=headers, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            logger.debug("[%s] Not modified since the cached response", self.name)
+            self._validators = (request, cached.etag, cached.last_modified)
+            return response, None
+        json = response.json()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if conditional and response.ok and (etag or last_modified):
+            self._validators = (request, etag, last_modified)
+        return response, json
+
+    def get_next_refresh(self):
+        """Returns the time get_data will next request from the API."""
+        if self._retry_at is not None:
+            return self._retry_at
+        if self.api_last_refresh is None:
+            return time.time()
+        return self.api_last_refresh + self.api_refresh_interval
+
+    def get_snapshot(self):
+        """Returns the latest data published by the service, None if there is none yet."""
+        return get_snapshot_store().get(self.name)
+
+    async def run(self):
+        """Requests the data whenever it is due and publishes it to the snapshot store,
+            until cancelled. Requests run on a worker thread so the event loop never waits on them."""
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            timeout = max(self.get_next_refresh() - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self.get_next_refresh() > time.time():
+                continue
+            try:
+                data = await loop.run_in_executor(_FETCH, self.get_data)
+            except Exception as e:
+                logger.error("[%s] Request failed: %s", self.name, e)
+                continue
+            if data is not None:
+                get_snapshot_store().publish(self.name, data)
+            elif self.is_failing():
+                self._serve_stale()
+
+    def wake(self):
+        """Wakes the fetch task to check whether a request is due."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def apply_config(self, changes):
+        """Applies the changed (section, key) settings of the service.
+            Returns True if the data must be requested again."""
+        return False
 
     def _request(self):
         pass
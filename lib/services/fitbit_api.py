@@ -3,22 +3,43 @@ from base64 import b64encode
 from datetime import datetime
 from hashlib import sha256
 import logging
-import requests
 from secrets import token_hex
 import time
 from urllib.parse import urlencode
 
-import requests.utils
-
 from config import get_fitbit_config
 from lib.services.api import APIService
+from lib.services.service_record import ServiceRecord
 
 logger = logging.getLogger()
 
+class FitbitRecord(ServiceRecord):
+    """Class to hold the steps drawn by the fitbit panel."""
+    __slots__ = ("steps", "goal")
+    FIELDS = {
+        "steps": ("summary", "steps"),
+        "goal": ("goals", "steps")
+    }
+
 class FitbitService(APIService):
     """Dataclass for API services."""
+    record_type = FitbitRecord
+
     def __init__(self):
-        super().__init__(get_fitbit_config().api_key, get_fitbit_config().api_urls, get_fitbit_config().api_refresh_interval)
+        super().__init__(get_fitbit_config().api_key, get_fitbit_config().api_urls, get_fitbit_config().api_refresh_interval, "FITBIT")
+
+    def apply_config(self, changes):
+        keys = {key for section, key in changes if section == "FITBIT"}
+        if len(keys) == 0:
+            return False
+        config = get_fitbit_config()
+        self.api_key = config.api_key
+        self.api_urls = config.api_urls
+        self.api_refresh_interval = config.api_refresh_interval
+        if keys <= {"refresh_interval", "code_verifier"}:
+            return False
+        self.reset()
+        return True
 
     def generate_code_challenge(self):
         """Generates a code verifier and challenge for the authorization."""
@@ -35,7 +56,7 @@ class FitbitService(APIService):
         if get_fitbit_config().api_access_token == "":
             logger.debug("[FITBIT] No access token found for Fitbit")
             logger.debug("[FITBIT] Attempting to login to Fitbit")
-            response = requests.post(self.get_login_url(self.get_login_params(get_fitbit_config().api_key)), headers={"Content-type":"application/x-www-form-urlencoded"}, timeout=10)
+            response = self._http.post(self.get_login_url(self.get_login_params(get_fitbit_config().api_key)), headers={"Content-type":"application/x-www-form-urlencoded"})
             json = response.json()
             if "error" in json:
                 logger.error("[FITBIT] %s", json["error"])
@@ -46,15 +67,17 @@ class FitbitService(APIService):
             logger.error("[FITBIT] Could not get access token")
             return None
         date = datetime.now().strftime("%Y-%m-%d")
-        response = requests.get(get_fitbit_config().api_urls[2] + date + ".json", headers=self.get_request_headers(access_token), timeout=10)
-        json = response.json()
+        response, json = self._get_json(get_fitbit_config().api_urls[2] + date + ".json", headers=self.get_request_headers(access_token))
+        if json is None:
+            return self._get_cached_data()
         # Check if the API returned an error
         if not response.ok:
             logger.error("[FITBIT] %s", json)
             return None
+        record = FitbitRecord.from_json(json)
         logger.debug("[FITBIT] Successfully retrieved data from Fitbit")
-        logger.debug("[FITBIT] %i, %s", response.status_code, response.json())
-        return json
+        logger.debug("[FITBIT] %i, %s", response.status_code, record)
+        return record
     
     def set_tokens(self, json):
         """Sets the access token and refresh token in config."""
@@ -109,7 +132,7 @@ class FitbitService(APIService):
         """Returns the access token for the API."""
         if time.time() > get_fitbit_config().api_expiry - 60:
             logger.debug("[FITBIT] Access token has expired. Refreshing.")
-            response = requests.post(self.get_login_url(), headers={"Content-type":"application/x-www-form-urlencoded"}, data=self.get_refresh_body(), timeout=10)
+            response = self._http.post(self.get_login_url(), headers={"Content-type":"application/x-www-form-urlencoded"}, data=self.get_refresh_body())
             json = response.json()
             if not response.ok or "error" in json:
                 logger.error("[FITBIT] %s", json)
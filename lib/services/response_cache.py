@@ -0,0 +1,73 @@
+"""Persistent cache of service responses.
+    The last data of each service is kept with the time it was requested, so after a restart
+    it can be shown straight away, and with the validators of the response it was read from,
+    so the next request can be conditional."""
+import json
+import logging
+import os
+
+from config import get_config, write_file_atomic
+
+logger = logging.getLogger()
+
+class CachedResponse:
+    """Class to hold the last data of a service and the validators of the response it came from."""
+    __slots__ = ("time", "data", "tag", "request", "etag", "last_modified")
+
+    def __init__(self, time, data, tag, request=None, etag=None, last_modified=None):
+        self.time = time
+        self.data = data
+        self.tag = tag
+        self.request = request
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def to_dict(self):
+        """Return the response as a dictionary to save as JSON."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class ResponseCache:
+    """ResponseCache class, holds the last response of each service by name.
+        Each service is saved to its own JSON file, written atomically."""
+    def __init__(self, directory=None):
+        self._directory = directory
+        if self._directory:
+            os.makedirs(self._directory, exist_ok=True)
+
+    def is_persistent(self):
+        """Return True if responses are saved to disk."""
+        return bool(self._directory)
+
+    def _get_file(self, name):
+        return os.path.join(self._directory, f"{name.lower()}.json")
+
+    def load(self, name):
+        """Return the saved response of the service, None if there is none."""
+        if not self.is_persistent():
+            return None
+        try:
+            with open(self._get_file(name), encoding="utf-8") as file:
+                return CachedResponse(**json.load(file))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("[ResponseCache] Could not read the %s response: %s", name, e)
+            return None
+
+    def save(self, name, response):
+        """Save the response of the service."""
+        if not self.is_persistent():
+            return
+        try:
+            write_file_atomic(self._get_file(name), json.dumps(response.to_dict()))
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning("[ResponseCache] Could not save the %s response: %s", name, e)
+
+_RESPONSE_CACHE = None
+
+def get_response_cache():
+    """Return the cache of the service responses, created on first use."""
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None:
+        _RESPONSE_CACHE = ResponseCache(get_config().http.cache_dir)
+    return _RESPONSE_CACHE
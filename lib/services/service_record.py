@@ -0,0 +1,38 @@
+"""Compact records of the service data drawn by the panels."""
+
+class ServiceRecord:
+    """Base class for the data of a service. Only the fields the panels draw are kept,
+        FIELDS maps each slot to its path in the JSON of the response."""
+    __slots__ = ()
+    FIELDS = {}
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    @classmethod
+    def from_json(cls, json, **values):
+        """Return the record of the fields in the JSON of a response,
+            the values of any other slots are given as keywords.
+            Raises KeyError or TypeError if a field is missing."""
+        for name, path in cls.FIELDS.items():
+            value = json
+            for key in path:
+                value = value[key]
+            values[name] = value
+        return cls(**values)
+
+    def to_dict(self):
+        """Return the fields of the record as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    # Records are compared by value, their fields can change and can hold dicts,
+    # so they are not hashable
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
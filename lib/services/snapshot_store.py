@@ -0,0 +1,54 @@
+"""Store for the latest data of each service.
+    Services publish from their fetch tasks and panels read the latest snapshot while drawing,
+    so drawing never waits on a request."""
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+class Snapshot:
+    """Class to hold the data a service published and when."""
+    __slots__ = ("data", "time", "version")
+
+    def __init__(self, data, version):
+        self.data = data
+        self.time = time.time()
+        self.version = version
+
+class SnapshotStore:
+    """SnapshotStore class, holds the latest snapshot of each service by name."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call listener with the name of the service each time a snapshot is published."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stop calling listener."""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def publish(self, name, data):
+        """Replace the snapshot of the service with its new data."""
+        with self._lock:
+            previous = self._snapshots.get(name)
+            version = 1 if previous is None else previous.version + 1
+            self._snapshots[name] = Snapshot(data, version)
+        logger.debug("[SnapshotStore] %s published version %d", name, version)
+        for listener in self._listeners:
+            listener(name)
+
+    def get(self, name):
+        """Return the latest snapshot of the service, None if it has not published yet."""
+        with self._lock:
+            return self._snapshots.get(name)
+
+_SNAPSHOTS = SnapshotStore()
+
+def get_snapshot_store():
+    """Return the store of the latest service data."""
+    return _SNAPSHOTS
@@ -2,26 +2,148 @@
 import time
 import logging
 
-import requests
-
 from config import get_weather_config
 from lib.services.api import APIService
+from lib.services.service_record import ServiceRecord
 
 logger = logging.getLogger()
 
+# Fields of the current conditions and of each forecast day requested from the API
+WEATHER_ELEMENTS = "datetime,temp,tempmax,tempmin,icon,conditions"
+
+class ForecastRecord(ServiceRecord):
+    """Class to hold the forecast of one day."""
+    __slots__ = ("date", "icon", "temp_max", "temp_min", "conditions")
+    FIELDS = {
+        "date": ("datetime",),
+        "icon": ("icon",),
+        "temp_max": ("tempmax",),
+        "temp_min": ("tempmin",),
+        "conditions": ("conditions",)
+    }
+
+class WeatherRecord(ServiceRecord):
+    """Class to hold the current weather conditions and the forecast of one location."""
+    __slots__ = ("icon", "temp", "conditions", "forecast")
+    FIELDS = {
+        "icon": ("currentConditions", "icon"),
+        "temp": ("currentConditions", "temp"),
+        "conditions": ("currentConditions", "conditions")
+    }
+
+    def __init__(self, **values):
+        super().__init__(**values)
+        self.forecast = tuple(
+            day if isinstance(day, ForecastRecord) else ForecastRecord(**day)
+            for day in self.forecast
+        )
+
+    def to_dict(self):
+        values = super().to_dict()
+        values["forecast"] = [day.to_dict() for day in self.forecast]
+        return values
+
+class WeatherReport(ServiceRecord):
+    """Class to hold the weather of every location, shared by the weather panels."""
+    __slots__ = ("locations",)
+
+    def __init__(self, **values):
+        super().__init__(**values)
+        self.locations = {
+            location: record if isinstance(record, WeatherRecord) else WeatherRecord(**record)
+            for location, record in self.locations.items()
+        }
+
+    def to_dict(self):
+        return {
+            "locations": {
+                location: record.to_dict() for location, record in self.locations.items()
+            }
+        }
+
 class WeatherService(APIService):
-    """Dataclass for API services."""
+    """Dataclass for API services.
+        Every location is requested in one call to the multi location API,
+        or one call each if its URL is not configured."""
+    record_type = WeatherReport
+
     def __init__(self):
-        super().__init__(get_weather_config().api_key, get_weather_config().api_urls, get_weather_config().api_refresh_interval)
-        self.city = get_weather_config().city
+        super().__init__(get_weather_config().api_key, get_weather_config().api_urls, get_weather_config().api_refresh_interval, "WEATHER")
+        self.locations = get_weather_config().locations
+        self.forecast_days = get_weather_config().forecast_days
         self.units = get_weather_config().units
 
+    def apply_config(self, changes):
+        keys = {key for section, key in changes if section == "WEATHER"}
+        if len(keys) == 0:
+            return False
+        config = get_weather_config()
+        self.api_key = config.api_key
+        self.api_urls = config.api_urls
+        self.api_refresh_interval = config.api_refresh_interval
+        self.locations = config.locations
+        self.forecast_days = config.forecast_days
+        self.units = config.units
+        if keys == {"refresh_interval"}:
+            return False
+        self.reset()
+        return True
+
+    def get_cache_tag(self):
+        return f"{super().get_cache_tag()} {'|'.join(self.locations)} {self.forecast_days}"
+
+    def _get_params(self):
+        """Returns the query parameters shared by every request."""
+        return {
+            "key": self.api_key,
+            "include": "current,days" if self.forecast_days > 0 else "current",
+            "elements": WEATHER_ELEMENTS,
+            "iconSet": "icons1"
+        }
+
+    def _get_record(self, json):
+        """Returns the weather record of the JSON of one location."""
+        return WeatherRecord.from_json(json, forecast=tuple(
+            ForecastRecord.from_json(day) for day in json.get("days", [])[:self.forecast_days]
+        ))
+
     def _request(self):
-        response = requests.request("GET", self.api_urls[0] + self.city, params={"key": self.api_key, "include":"current", "iconSet":"icons1"}, timeout=10)
-        logger.debug("[WEATHER] %i, %s", response.status_code, response.json())
-        json = response.json()
-        # Check if the API returned an error
-        if "error" in json:
-            logger.error("[WEATHER] %s", json["error"])
-            return None
-        return json["currentConditions"]
+        if len(self.locations) > 1 and len(self.api_urls) > 1:
+            params = self._get_params()
+            params["locations"] = "|".join(self.locations)
+            response, json = self._get_json(self.api_urls[1], params=params)
+            if json is None:
+                return self._get_cached_data()
+            # Check if the API returned an error
+            if "error" in json:
+                logger.error("[WEATHER] %s", json["error"])
+                return None
+            records = [self._get_record(location) for location in json["locations"]]
+        else:
+            records = []
+            for location in self.locations:
+                # Conditional requests only work for a single request per refresh
+                response, json = self._get_json(
+                    self.api_urls[0] + location, params=self._get_params(),
+                    conditional=len(self.locations) == 1
+                )
+                if json is None:
+                    return self._get_cached_data()
+                # Check if the API returned an error
+                if "error" in json:
+                    logger.error("[WEATHER] %s", json["error"])
+                    return None
+                records.append(self._get_record(json))
+        report = WeatherReport(locations=dict(zip(self.locations, records)))
+        logger.debug("[WEATHER] %i, %s", response.status_code, report)
+        return report
+
+_WEATHER_SERVICE = None
+
+def get_weather_service():
+    """Returns the weather service shared by the weather panels,
+        created by the first panel so the WEATHER section is only read when it is used."""
+    global _WEATHER_SERVICE
+    if _WEATHER_SERVICE is None:
+        _WEATHER_SERVICE = WeatherService()
+    return _WEATHER_SERVICE
@@ -29,7 +29,9 @@
 
 
 import logging
+from PIL import Image
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -113,8 +115,8 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        if not epdconfig.wait_busy_release(self.busy_pin, 1):      # 0: idle, 1: busy
+            logger.warning("e-Paper busy timeout")
 
     def TurnOnDisplay(self):
         self.send_command(0x22)
@@ -223,29 +225,20 @@ class EPD:
             linewidth = int(self.width/8)
         else:
             linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
+
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
+
         if(imwidth == self.width and imheight == self.height):
             logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+            # The image is mirrored, pixel x is sent as pixel imwidth - x
+            canvas = Image.new('1', (linewidth * 8, self.height), 255)
+            canvas.paste(image_monocolor.transpose(Image.FLIP_LEFT_RIGHT), (1, 0))
+            return epdbuffer.pack_1bit(canvas)
         elif(imwidth == self.height and imheight == self.width):
             logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+            return epdbuffer.pack_1bit(image_monocolor.transpose(Image.TRANSPOSE))
+        return [0xFF] * (linewidth * self.height)
         
         
     def display(self, image):
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -137,8 +138,8 @@ class EPD:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
+        if not epdconfig.wait_busy_release(self.busy_pin, 1):      # 0: idle, 1: busy
+            logger.warning("e-Paper busy timeout")
         logger.debug("e-Paper busy release")
 
     '''
@@ -283,7 +284,7 @@ class EPD:
             # return a blank buffer
             return [0x00] * (int(self.width/8) * self.height)
 
-        buf = bytearray(img.tobytes('raw'))
+        buf = epdbuffer.pack_1bit(img, padding=0)
         return buf
         
     '''
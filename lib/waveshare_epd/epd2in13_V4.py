@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -93,8 +94,8 @@ class EPD:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
+        if not epdconfig.wait_busy_release(self.busy_pin, 1):      # 0: idle, 1: busy
+            logger.warning("e-Paper busy timeout")
         logger.debug("e-Paper busy release")
 
     '''
@@ -257,7 +258,7 @@ class EPD:
             # return a blank buffer
             return [0x00] * (int(self.width/8) * self.height)
 
-        buf = bytearray(img.tobytes('raw'))
+        buf = epdbuffer.pack_1bit(img, padding=0)
         return buf
         
     '''
@@ -307,6 +308,54 @@ class EPD:
         self.send_data2(image)  
         self.TurnOnDisplayPart()
 
+    '''
+    function : Sends only a window of the image buffer to e-Paper and partial refresh
+    parameter:
+        image : Image data of the whole screen
+        x_start : X-axis starting position
+        y_start : Y-axis starting position
+        x_end : End position of X-axis
+        y_end : End position of Y-axis
+    '''
+    def displayPartialWindow(self, image, x_start, y_start, x_end, y_end):
+        if self.width%8 == 0:
+            linewidth = int(self.width/8)
+        else:
+            linewidth = int(self.width/8) + 1
+        # x point must be the multiple of 8, widen the window to whole bytes
+        x_start = x_start // 8 * 8
+        x_end = x_end // 8 * 8 + 7
+
+        epdconfig.digital_write(self.reset_pin, 0)
+        epdconfig.delay_ms(1)
+        epdconfig.digital_write(self.reset_pin, 1)
+
+        self.send_command(0x3C) # BorderWavefrom
+        self.send_data(0x80)
+
+        self.send_command(0x01) # Driver output control
+        self.send_data(0xF9)
+        self.send_data(0x00)
+        self.send_data(0x00)
+
+        self.send_command(0x11) # data entry mode
+        self.send_data(0x03)
+
+        self.SetWindow(x_start, y_start, x_end, y_end)
+        self.SetCursor(x_start >> 3, y_start)
+
+        window = bytearray()
+        for y in range(y_start, y_end + 1):
+            window += bytes(image[y * linewidth + (x_start >> 3):y * linewidth + (x_end >> 3) + 1])
+
+        self.send_command(0x24) # WRITE_RAM
+        self.send_data2(window)
+
+        # Restore the full window, full buffer writes that follow do not set it
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.SetCursor(0, 0)
+        self.TurnOnDisplayPart()
+
     '''
     function : Refresh a base image
     parameter:
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -78,8 +79,8 @@ class EPD:
     # judge e-Paper whether is busy
     def busy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) != 0): 
-            epdconfig.delay_ms(10)
+        if not epdconfig.wait_busy_release(self.busy_pin, 1):
+            logger.warning("e-Paper busy timeout")
         logger.debug("e-Paper busy release")
 
     # set the display window
@@ -158,7 +159,7 @@ class EPD:
             # return a blank buffer
             return [0x00] * (int(self.width/8) * self.height)
 
-        buf = bytearray(img.tobytes('raw'))
+        buf = epdbuffer.pack_1bit(img, padding=0)
         return buf
 
     # display image
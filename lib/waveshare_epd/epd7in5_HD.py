@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 880
@@ -75,9 +76,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
+        if not epdconfig.wait_busy_release(self.busy_pin, 1):
+            logger.warning("e-Paper busy timeout")
         epdconfig.delay_ms(200)
         
     def init(self):
@@ -142,7 +142,7 @@ class EPD:
             # return a blank buffer
             return [0xff] * int(self.width * self.height / 8)
 
-        buf = bytearray(img.tobytes('raw'))
+        buf = epdbuffer.pack_1bit(img, padding=0)
         return buf
         
     def display(self, image):
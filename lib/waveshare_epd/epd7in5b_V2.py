@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -76,10 +77,8 @@ class EPD:
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
+        while not epdconfig.wait_busy_release(self.busy_pin, 0, 20):
             self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
         epdconfig.delay_ms(200)
         logger.debug("e-Paper busy release")
         
@@ -145,12 +144,9 @@ class EPD:
             # return a blank buffer
             return [0x00] * (int(self.width/8) * self.height)
 
-        buf = bytearray(img.tobytes('raw'))
         # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
         # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+        return epdbuffer.invert(epdbuffer.pack_1bit(img, padding=0))
 
     def display(self, imageblack, imagered):
         self.send_command(0x10)
@@ -0,0 +1,148 @@
+"""Image buffer packing shared by the e-Paper drivers.
+    Pixels are packed with Image.tobytes, bytes.translate and slicing instead of
+    per pixel Python loops, so large panels pack in milliseconds on a Pi Zero."""
+import logging
+from operator import or_
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SHIFT_1 = bytes((value << 1) & 0xFF for value in range(256))
+SHIFT_2 = bytes((value << 2) & 0xFF for value in range(256))
+SHIFT_4 = bytes((value << 4) & 0xFF for value in range(256))
+SHIFT_6 = bytes((value << 6) & 0xFF for value in range(256))
+INVERT = bytes(value ^ 0xFF for value in range(256))
+
+def _gray_level(value):
+    """Return the 2 bit gray level the 4 gray drivers send for an 8 bit gray value."""
+    if value == 0xC0:
+        value = 0x80
+    elif value == 0x80:
+        value = 0x40
+    return (value & 0xC0) >> 6
+
+GRAY_4 = bytes(_gray_level(value) for value in range(256))
+
+def orient(image, width, height):
+    """Return the image in the orientation of the panel RAM, None if the dimensions do not match.
+        Landscape images are rotated 90 degrees counter clockwise."""
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        logger.debug("Vertical")
+        return image
+    if imwidth == height and imheight == width:
+        logger.debug("Horizontal")
+        return image.rotate(90, expand=True)
+    logger.debug("Wrong image dimensions: must be %dx%d", width, height)
+    return None
+
+def pack_1bit(image, padding=255):
+    """Pack a mode '1' image at 1 bit per pixel, 1 is white.
+        Rows are padded to whole bytes with the padding colour."""
+    imwidth, imheight = image.size
+    if imwidth % 8 != 0 and padding != 0:
+        canvas = Image.new('1', ((imwidth + 7) // 8 * 8, imheight), padding)
+        canvas.paste(image, (0, 0))
+        image = canvas
+    return bytearray(image.tobytes('raw'))
+
+def pack_2bit(data, width):
+    """Pack one byte per pixel data at 2 bits per pixel, first pixel in the high bits.
+        Rows are padded to whole bytes with 0."""
+    data = bytes(data)
+    if width % 4 != 0:
+        padding = bytes(4 - width % 4)
+        data = b"".join(
+            data[start:start + width] + padding for start in range(0, len(data), width)
+        )
+    high = map(or_, data[0::4].translate(SHIFT_6), data[1::4].translate(SHIFT_4))
+    low = map(or_, data[2::4].translate(SHIFT_2), data[3::4])
+    return bytearray(map(or_, high, low))
+
+def pack_4bit(data):
+    """Pack one byte per pixel data at 4 bits per pixel, first pixel in the high bits."""
+    data = bytes(data)
+    return bytearray(map(or_, data[0::2].translate(SHIFT_4), data[1::2]))
+
+def pack_4gray(image):
+    """Pack a mode 'L' image at 2 bits per pixel with the 4 gray levels of the panels."""
+    return pack_2bit(image.tobytes('raw').translate(GRAY_4), image.size[0])
+
+def match_palette(image, palette):
+    """Return one byte per pixel with the index of the palette colour matching each pixel
+        of an RGB image exactly, 0 if none match. Each channel may use up to 3 levels."""
+    shifts = (4, 2, 0)
+    levels = [sorted({colour[band] for colour in palette}) for band in range(3)]
+    if any(len(band_levels) > 3 for band_levels in levels):
+        raise ValueError("Palette must use at most 3 levels per channel")
+    # Key of each pixel is the 2 bit level code of each channel, 0 if the level is not used
+    channels = []
+    for band, shift in enumerate(shifts):
+        codes = bytearray(256)
+        for code, level in enumerate(levels[band], 1):
+            codes[level] = code << shift
+        channels.append(image.getchannel(band).tobytes('raw').translate(codes))
+    table = bytearray(256)
+    for index, colour in enumerate(palette):
+        key = 0
+        for band, shift in enumerate(shifts):
+            key |= (levels[band].index(colour[band]) + 1) << shift
+        table[key] = index
+    keys = bytes(map(or_, map(or_, channels[0], channels[1]), channels[2]))
+    return keys.translate(table)
+
+def unpack_1bit(buf):
+    """Return one byte per pixel, 0 or 1, of a buffer packed at 1 bit per pixel."""
+    image = Image.frombytes('1', (len(buf) * 8, 1), bytes(buf))
+    return image.convert('L').tobytes('raw').translate(bytes([0] * 255 + [1]))
+
+def pack_dual_plane(imageblack, imagered, black=0x00, red=0x04, white=0x03):
+    """Merge black and red 1 bit planes into 4 bits per pixel colour codes.
+        A cleared bit in the red plane wins over a cleared bit in the black plane."""
+    # Key of each pixel is (red bit << 1) | black bit
+    codes = bytes([red, red, black, white]) + bytes(252)
+    keys = bytes(map(
+        or_, unpack_1bit(imageblack), unpack_1bit(imagered).translate(SHIFT_1)
+    ))
+    return pack_4bit(keys.translate(codes))
+
+def invert(buf):
+    """Return the buffer with every bit inverted."""
+    return bytearray(bytes(buf).translate(INVERT))
+
+def diff_window(old, new, linewidth):
+    """Return the window (x_start, y_start, x_end, y_end) holding every byte that differs
+        between two buffers of rows linewidth bytes long, in bytes and rows, inclusive.
+        Returns None if the buffers are equal and the whole buffer if their sizes differ."""
+    old = bytes(old)
+    new = bytes(new)
+    if old == new:
+        return None
+    if len(old) != len(new):
+        return (0, 0, linewidth - 1, (len(new) + linewidth - 1) // linewidth - 1)
+    changed = [
+        start for start in range(0, len(new), linewidth)
+        if old[start:start + linewidth] != new[start:start + linewidth]
+    ]
+    # Bits set in mask are the columns changed in any row, the first byte is the most significant
+    mask = 0
+    for start in changed:
+        mask |= (
+            int.from_bytes(old[start:start + linewidth], 'big')
+            ^ int.from_bytes(new[start:start + linewidth], 'big')
+        )
+    return (
+        linewidth - 1 - (mask.bit_length() - 1) // 8,
+        changed[0] // linewidth,
+        linewidth - 1 - ((mask & -mask).bit_length() - 1) // 8,
+        changed[-1] // linewidth
+    )
+
+def getbuffer(image, width, height):
+    """Return the 1 bit per pixel buffer of an image for a panel of width x height.
+        Returns a white buffer if the dimensions do not match."""
+    image_monocolor = orient(image.convert('1'), width, height)
+    if image_monocolor is None:
+        return [0xFF] * ((width + 7) // 8 * height)
+    return pack_1bit(image_monocolor)
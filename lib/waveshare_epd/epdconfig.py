@@ -31,10 +31,31 @@ import os
 import logging
 import sys
 import time
+import asyncio
 import subprocess
 
 logger = logging.getLogger(__name__)
 
+# Longest wait for the BUSY pin to be released, the slowest colour panels refresh in about 30s
+BUSY_TIMEOUT_MS = 60000
+# Longest single wait for an edge, the level is checked again after each one
+EDGE_SLICE_MS = 100
+
+
+def _wait_for_edge(GPIO, pin, busy, timeout_ms):
+    # Wait in slices so an edge between reading the level and arming the wait is not missed
+    edge = GPIO.FALLING if busy else GPIO.RISING
+    deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000.0
+    while GPIO.input(pin) == busy:
+        slice_ms = EDGE_SLICE_MS
+        if deadline is not None:
+            remaining_ms = (deadline - time.monotonic()) * 1000.0
+            if remaining_ms <= 0:
+                return False
+            slice_ms = max(1, min(slice_ms, int(remaining_ms)))
+        GPIO.wait_for_edge(pin, edge, timeout=slice_ms)
+    return True
+
 
 class RaspberryPi:
     # Pin definition
@@ -89,6 +110,13 @@ class RaspberryPi:
         elif pin == self.PWR_PIN:
             return self.PWR_PIN.value
 
+    def wait_busy_release(self, pin, busy, timeout_ms=BUSY_TIMEOUT_MS):
+        # gpiozero waits on an event set from the edge callbacks, no polling
+        timeout = None if timeout_ms is None else timeout_ms / 1000.0
+        if busy:
+            return self.GPIO_BUSY_PIN.wait_for_inactive(timeout)
+        return self.GPIO_BUSY_PIN.wait_for_active(timeout)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -160,6 +188,9 @@ class JetsonNano:
     def digital_read(self, pin):
         return self.GPIO.input(self.BUSY_PIN)
 
+    def wait_busy_release(self, pin, busy, timeout_ms=BUSY_TIMEOUT_MS):
+        return _wait_for_edge(self.GPIO, self.BUSY_PIN, busy, timeout_ms)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -218,6 +249,9 @@ class SunriseX3:
     def digital_read(self, pin):
         return self.GPIO.input(pin)
 
+    def wait_busy_release(self, pin, busy, timeout_ms=BUSY_TIMEOUT_MS):
+        return _wait_for_edge(self.GPIO, pin, busy, timeout_ms)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -263,22 +297,217 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if sys.version_info[0] == 2:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
-else:
-    process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
-output, _ = process.communicate()
-if sys.version_info[0] == 2:
-    output = output.decode(sys.stdout.encoding)
-
-if "Raspberry" in output:
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
+class Virtual:
+    """Simulated panel for running without hardware, select it with EPD_BACKEND=virtual.
+    Records every command and data byte, models the BUSY pin of SSD16xx controllers
+    such as the 2.13inch V4 and rebuilds the controller RAM written with 0x24 and 0x26.
+    Delays and BUSY times are scaled by EPD_VIRTUAL_TIME_SCALE, 0 runs instantly."""
+    # Pin definition
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+
+    # RAM size of the SSD1680, 176 sources x 296 gates
+    RAM_WIDTH = 176
+    RAM_HEIGHT = 296
+
+    # Busy time in ms of 0x20 Activate Display Update for each 0x22 Display Update Control value
+    UPDATE_BUSY_MS = {
+        0xF7: 2000, # full
+        0xC7: 1500, # fast
+        0xFF: 300,  # partial
+        0xB1: 10,   # load temperature
+        0x91: 10,   # load temperature
+    }
+    SWRESET_BUSY_MS = 10
+
+    def __init__(self):
+        self._time_scale = float(os.environ.get('EPD_VIRTUAL_TIME_SCALE', '1'))
+        self._ram = {
+            0x24: bytearray([0xFF] * (self.RAM_WIDTH // 8 * self.RAM_HEIGHT)),
+            0x26: bytearray([0xFF] * (self.RAM_WIDTH // 8 * self.RAM_HEIGHT)),
+        }
+        self._displayed = bytes(self._ram[0x24])
+        self._commands = []
+        self._pins = {self.RST_PIN: 1, self.DC_PIN: 0, self.CS_PIN: 1, self.PWR_PIN: 0}
+        self._busy_until = 0
+        self._command = None
+        self._params = []
+        self._update_control = 0xF7
+        self._entry_mode = 0x03
+        self._window = (0, self.RAM_WIDTH // 8 - 1, 0, self.RAM_HEIGHT - 1)
+        self._cursor = [0, 0]
+        self.reset_counters()
+
+    def set_time_scale(self, time_scale):
+        self._time_scale = time_scale
+
+    def reset_counters(self):
+        self._counters = {
+            'commands': 0,
+            'data_bytes': 0,
+            'ram_bytes': 0,
+            'updates': 0,
+            'resets': 0,
+            'busy_ms': 0,
+            'delay_ms': 0,
+        }
+
+    def get_counters(self):
+        return dict(self._counters)
+
+    def get_commands(self):
+        return list(self._commands)
+
+    def clear_commands(self):
+        self._commands = []
+
+    def _set_busy(self, busy_ms):
+        self._counters['busy_ms'] += busy_ms
+        self._busy_until = time.monotonic() + busy_ms / 1000.0 * self._time_scale
+
+    def digital_write(self, pin, value):
+        if pin == self.RST_PIN and value and not self._pins[self.RST_PIN]:
+            self._counters['resets'] += 1
+            self._busy_until = 0
+        if pin in self._pins:
+            self._pins[pin] = value
+
+    def digital_read(self, pin):
+        if pin == self.BUSY_PIN:
+            return 1 if time.monotonic() < self._busy_until else 0
+        return self._pins.get(pin, 0)
+
+    def wait_busy_release(self, pin, busy, timeout_ms=BUSY_TIMEOUT_MS):
+        # Sleep until the modelled update finishes instead of polling
+        deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000.0
+        while self.digital_read(pin) == busy:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            wake = self._busy_until if self._busy_until > now else now + EDGE_SLICE_MS / 1000.0
+            if deadline is not None:
+                wake = min(wake, deadline)
+            time.sleep(wake - now)
+        return True
+
+    def delay_ms(self, delaytime):
+        self._counters['delay_ms'] += delaytime
+        time.sleep(delaytime / 1000.0 * self._time_scale)
+
+    def _send_command(self, command):
+        self._counters['commands'] += 1
+        self._command = command
+        self._params = []
+        self._commands.append((command, bytearray()))
+        if command == 0x12: # SWRESET
+            self._set_busy(self.SWRESET_BUSY_MS)
+        elif command == 0x20: # Activate Display Update Sequence
+            self._counters['updates'] += 1
+            self._displayed = bytes(self._ram[0x24])
+            self._set_busy(self.UPDATE_BUSY_MS.get(self._update_control, 2000))
+
+    def _write_ram(self, ram, value):
+        x, y = self._cursor
+        linewidth = self.RAM_WIDTH // 8
+        if 0 <= x < linewidth and 0 <= y < self.RAM_HEIGHT:
+            ram[y * linewidth + x] = value
+        self._counters['ram_bytes'] += 1
+        x_start, x_end, y_start, y_end = self._window
+        x_step = 1 if self._entry_mode & 0x01 else -1
+        y_step = 1 if self._entry_mode & 0x02 else -1
+        if self._entry_mode & 0x04: # Y address counter updated first
+            if y == y_end:
+                self._cursor = [x + x_step if x != x_end else x_start, y_start]
+            else:
+                self._cursor = [x, y + y_step]
+        elif x == x_end:
+            self._cursor = [x_start, y + y_step if y != y_end else y_start]
+        else:
+            self._cursor = [x + x_step, y]
+
+    def _send_data(self, value):
+        self._counters['data_bytes'] += 1
+        if self._commands:
+            self._commands[-1][1].append(value)
+        if self._command in self._ram:
+            self._write_ram(self._ram[self._command], value)
+            return
+        self._params.append(value)
+        params = self._params
+        if self._command == 0x22 and len(params) == 1:
+            self._update_control = params[0]
+        elif self._command == 0x11 and len(params) == 1:
+            self._entry_mode = params[0]
+        elif self._command == 0x44 and len(params) == 2:
+            self._window = (params[0], params[1]) + self._window[2:]
+        elif self._command == 0x45 and len(params) == 4:
+            self._window = self._window[:2] + (params[0] | params[1] << 8, params[2] | params[3] << 8)
+        elif self._command == 0x4E and len(params) == 1:
+            self._cursor[0] = params[0]
+        elif self._command == 0x4F and len(params) == 2:
+            self._cursor[1] = params[0] | params[1] << 8
+
+    def _spi_write(self, data):
+        if self._pins[self.CS_PIN]:
+            return
+        if self._pins[self.DC_PIN]:
+            for value in data:
+                self._send_data(value & 0xFF)
+        else:
+            for value in data:
+                self._send_command(value & 0xFF)
+
+    def spi_writebyte(self, data):
+        self._spi_write(data)
+
+    def spi_writebyte2(self, data):
+        self._spi_write(data)
+
+    def get_image(self, width, height, ram=None):
+        """Return the panel RAM as an image, the last displayed frame by default."""
+        from PIL import Image
+
+        data = self._displayed if ram is None else bytes(self._ram[ram])
+        image = Image.frombytes('1', (self.RAM_WIDTH, self.RAM_HEIGHT), data)
+        return image.crop((0, 0, width, height))
+
+    def module_init(self):
+        self._pins[self.PWR_PIN] = 1
+        return 0
+
+    def module_exit(self, cleanup=False):
+        logger.debug("close 5V, Module enters 0 power consumption ...")
+        self._pins[self.PWR_PIN] = 0
+
+
+if os.environ.get('EPD_BACKEND', '').lower() == 'virtual':
+    implementation = Virtual()
 else:
-    implementation = JetsonNano()
+    if sys.version_info[0] == 2:
+        process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE)
+    else:
+        process = subprocess.Popen("cat /proc/cpuinfo | grep Raspberry", shell=True, stdout=subprocess.PIPE, text=True)
+    output, _ = process.communicate()
+    if sys.version_info[0] == 2:
+        output = output.decode(sys.stdout.encoding)
+
+    if "Raspberry" in output:
+        implementation = RaspberryPi()
+    elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+        implementation = SunriseX3()
+    else:
+        implementation = JetsonNano()
 
 for func in [x for x in dir(implementation) if not x.startswith('_')]:
     setattr(sys.modules[__name__], func, getattr(implementation, func))
 
+
+async def wait_busy_release_async(pin, busy, timeout_ms=BUSY_TIMEOUT_MS):
+    """Awaitable wait_busy_release, the wait runs in the default executor so the event loop keeps running."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, implementation.wait_busy_release, pin, busy, timeout_ms)
+
 ### END OF FILE ###
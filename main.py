@@ -69,7 +69,7 @@ def make_cli():
     background_parser = argparse.ArgumentParser(
         description="Set the background image of the screen"
     )
-    background_parser.add_argument('-i', type=str, help="Filename of the image in /bmp/",
+    background_parser.add_argument('-i', type=str, help="Filename of the image in /pic/",
                                   required=False, default=None)
 
     text_parser = argparse.ArgumentParser(description="Set the text of the Text Panel")
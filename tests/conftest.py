@@ -0,0 +1,24 @@
+"""Run the tests on the virtual e-paper backend with a copy of config.ini.
+    config.ini and the caches are read relative to the working directory,
+    so the tests run in a temporary directory and never touch the user's files."""
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def pytest_configure(config):
+    """Select the virtual backend and move to a temporary directory before anything is imported."""
+    os.environ['EPD_BACKEND'] = 'virtual'
+    os.environ['EPD_VIRTUAL_TIME_SCALE'] = '0'
+    sys.path.insert(0, ROOT)
+    config.clock_cwd = os.getcwd()
+    config.clock_tmpdir = tempfile.mkdtemp(prefix="clock-test-")
+    shutil.copy(os.path.join(ROOT, "config.ini"), config.clock_tmpdir)
+    os.chdir(config.clock_tmpdir)
+
+def pytest_unconfigure(config):
+    """Return to the starting directory and remove the temporary one."""
+    os.chdir(config.clock_cwd)
+    shutil.rmtree(config.clock_tmpdir, ignore_errors=True)
@@ -0,0 +1,103 @@
+"""Check the bytes the EPD driver sends by reading back the RAM of the virtual panel."""
+import asyncio
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from lib.waveshare_epd import epdconfig
+from lib.epd_driver import EPDDriver
+
+PANEL = epdconfig.implementation
+
+def make_frame(driver, boxes=()):
+    """Return a white frame with the boxes (x_start, y_start, x_end, y_end) filled black."""
+    image = Image.new('1', driver.get_dimensions(), 255)
+    draw = ImageDraw.Draw(image)
+    for box in boxes:
+        draw.rectangle((box[0], box[1], box[2] - 1, box[3] - 1), fill=0)
+    return image
+
+def get_mismatch(driver, frame):
+    """Return the box of the displayed panel RAM that differs from the frame, None if it matches."""
+    height, width = driver.get_dimensions()
+    expected = frame.rotate(90, expand=True).convert('1')
+    return ImageChops.difference(PANEL.get_image(width, height), expected).getbbox()
+
+@pytest.fixture(name="driver")
+def fixture_driver():
+    """Return an initialised driver showing a white frame, with the panel counters reset."""
+    driver = EPDDriver()
+    driver.init()
+    driver.clear()
+    driver.set_screen(make_frame(driver))
+    PANEL.reset_counters()
+    return driver
+
+def test_set_screen_matches_frame(driver):
+    frame = make_frame(driver, [(10, 10, 60, 40), (200, 80, 250, 122)])
+    driver.set_screen(frame)
+    assert get_mismatch(driver, frame) is None
+    counters = PANEL.get_counters()
+    assert counters['updates'] == 1
+    # The base image is written to both RAMs
+    height, width = driver.get_dimensions()
+    assert counters['ram_bytes'] == 2 * (width + 7) // 8 * height
+
+def test_partial_update_sends_only_the_changed_window(driver):
+    frame = make_frame(driver, [(100, 50, 120, 60)])
+    driver.update_screen(frame, (100, 50, 120, 60))
+    assert get_mismatch(driver, frame) is None
+    counters = PANEL.get_counters()
+    # 20 frame columns are 20 RAM rows, the 10 frame rows fit in 2 bytes of each
+    assert counters['ram_bytes'] == 20 * 2
+
+def test_region_limits_the_rows_compared(driver):
+    frame = make_frame(driver, [(100, 50, 120, 60), (200, 50, 220, 60)])
+    driver.update_screen(frame, (100, 50, 120, 60))
+    # Only the damaged region is sent, the change outside it is not compared
+    assert get_mismatch(driver, frame) is not None
+    assert PANEL.get_counters()['ram_bytes'] == 20 * 2
+    driver.update_screen(frame, None)
+    assert get_mismatch(driver, frame) is None
+
+def test_identical_frame_is_not_sent(driver):
+    driver.update_screen(make_frame(driver), (0, 0, 10, 10))
+    assert PANEL.get_counters()['ram_bytes'] == 0
+    assert PANEL.get_counters()['updates'] == 0
+
+def test_forced_full_refresh_writes_the_whole_frame(driver, monkeypatch):
+    # Keep the controller awake so no init resets the RAM window between updates
+    monkeypatch.setattr(driver._power, "should_sleep", lambda: False)
+    boxes = []
+    for index in range(9):
+        boxes.append((40 + index * 20, 60 - index * 5, 56 + index * 20, 70 + index * 5))
+        frame = make_frame(driver, boxes)
+        driver.update_screen(frame, boxes[-1])
+        assert get_mismatch(driver, frame) is None, f"update {index + 1}"
+
+def test_refresh_after_partial_update_writes_the_whole_frame(driver, monkeypatch):
+    monkeypatch.setattr(driver._power, "should_sleep", lambda: False)
+    frame = make_frame(driver, [(40, 30, 56, 45)])
+    driver.update_screen(frame, (40, 30, 56, 45))
+    monkeypatch.setattr("lib.epd_driver.REFRESH_TIME", 0)
+    driver.update_screen()
+    assert get_mismatch(driver, frame) is None
+
+def test_clock_shows_its_frame():
+    import clock  # pylint: disable=import-outside-toplevel
+    prog = clock.Clock()
+    mismatches = []
+
+    async def run():
+        task = asyncio.create_task(prog.run_clock())
+        await asyncio.sleep(1.5)
+        mismatches.append(get_mismatch(prog._epd_driver, prog._frame.get_image()))
+        task.cancel()
+        await task
+
+    PANEL.reset_counters()
+    # The clock exits once it has shut the display down
+    with pytest.raises(SystemExit):
+        asyncio.run(run())
+    assert mismatches == [None]
+    assert PANEL.get_counters()['updates'] > 0